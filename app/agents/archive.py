@@ -0,0 +1,104 @@
+import base64
+import io
+import json
+import os
+import time
+import zipfile
+from typing import IO, Iterable
+
+from google.cloud import storage
+
+# Resumable upload chunk size, must be a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+
+
+class ResultArchive:
+    """
+    Zip archive written straight into a forward-only stream such as an upload.
+
+    Nothing is staged on disk: entries are appended as they are produced and
+    only one entry is held in memory at a time. Already compressed images are
+    stored as-is; JSON is deflated.
+    """
+
+    def __init__(self, stream: IO[bytes]):
+        self._zip = zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _info(self, arcname: str, compress_type: int) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.compress_type = compress_type
+        return info
+
+    def add_bytes(self, arcname: str, data: bytes, compress: bool = False):
+        compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self._zip.writestr(self._info(arcname, compress_type), data)
+
+    def add_base64(self, arcname: str, data_b64: str):
+        """Decode a base64 image directly into an uncompressed entry."""
+        self.add_bytes(arcname, base64.b64decode(data_b64))
+
+    def add_json(self, arcname: str, data):
+        with self._zip.open(self._info(arcname, zipfile.ZIP_DEFLATED), "w") as entry:
+            with io.TextIOWrapper(entry, encoding="utf-8") as text:
+                if isinstance(data, str):
+                    text.write(data)
+                else:
+                    json.dump(data, text, indent=2, default=str)
+
+    def close(self):
+        self._zip.close()
+
+
+def open_upload_stream(bucket_name: str, blob_name: str, storage_client=None,
+                       content_type: str = "application/zip") -> IO[bytes]:
+    """
+    Open a chunked, resumable upload to `gs://bucket_name/blob_name` as a file.
+
+    `storage_client` defaults to a real client; anything exposing
+    `bucket(name).blob(name).open("wb", ...)` can stand in for it.
+    """
+    client = storage_client or storage.Client()
+    blob = client.bucket(bucket_name).blob(blob_name)
+    return blob.open("wb", chunk_size=UPLOAD_CHUNK_SIZE, content_type=content_type)
+
+
+def write_result_archive(stream: IO[bytes], screenshots: Iterable[tuple[str, str]], result_data):
+    """Write screenshots, decoded one at a time, and result.json into `stream` as a zip."""
+    with ResultArchive(stream) as archive:
+        for arcname, screenshot_b64 in screenshots:
+            try:
+                archive.add_base64(arcname, screenshot_b64)
+            except (ValueError, TypeError) as e:
+                print(f"Error processing screenshot {arcname}: {e}")
+        archive.add_json("result.json", result_data)
+
+
+def zip_and_upload_to_gcs(files_to_zip, result_data, bucket_name, destination_blob_name, storage_client=None):
+    """
+    Zips screenshots and result data straight into an upload to a Google Cloud Storage bucket.
+
+    Nothing is written to local disk: each screenshot is decoded into its zip
+    entry while the archive streams out in resumable upload chunks.
+    
+    Args:
+        files_to_zip (list): (archive path, base64 image) pairs to store next to the result
+        result_data (str or dict): Result data to include in the zip
+        bucket_name (str): Name of the GCS bucket
+        destination_blob_name (str): Name for the zip file in the bucket
+        storage_client: Optional storage client, e.g. a local stand-in for tests
+        
+    Returns:
+        str: Public URL of the uploaded zip file
+    """
+    with open_upload_stream(bucket_name, destination_blob_name, storage_client) as upload:
+        write_result_archive(upload, files_to_zip, result_data)
+
+    gcs_url = f"gs://{bucket_name}/{destination_blob_name}"
+    print(f"Zip file uploaded to {gcs_url}")
+    return gcs_url
@@ -1,18 +1,22 @@
 import asyncio
 import os
-import base64
+from contextlib import asynccontextmanager, nullcontext
 from datetime import datetime
-import zipfile
-import tempfile
 import json
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_anthropic import ChatAnthropic
 from browser_use import Agent
 from browser_use import BrowserSession
+from playwright.async_api import async_playwright, Browser
 import argparse
-from pydantic import SecretStr
+from agents.uploader import ArtifactUploader
+from agents.screenshots import ScreenshotStore
+from agents.history import serialize_history, peak_rss_bytes
+from agents.results_store import JobResultsWriter
+from agents.llm_registry import get_registry
+from agents.llm_cache import cache_stats
+from agents.progress import progress, current_task, attach_progress
+from agents.trajectories import TRAJECTORY_REPLAY, TrajectoryStore, replay_trajectory
+from utils.checkpoints import TaskCheckpoints
 
 # Add proper Google Cloud Storage import
 try:
@@ -28,230 +32,232 @@ except ImportError:
 # Load environment variables
 load_dotenv()
 
-def zip_and_upload_to_gcs(files_to_zip, result_data, bucket_name, destination_blob_name):
-    """
-    Zips files and result data and uploads the resulting archive to a Google Cloud Storage bucket.
-    
-    Args:
-        files_to_zip (list): List of file paths to be zipped
-        result_data (str or dict): Result data to include in the zip
-        bucket_name (str): Name of the GCS bucket
-        destination_blob_name (str): Name for the zip file in the bucket
-        
-    Returns:
-        str: Public URL of the uploaded zip file
+# Default number of tasks of a single job that may run at the same time
+DEFAULT_CONCURRENCY = int(os.getenv("AGENT_CONCURRENCY", "1"))
+VIEWPORT = {'width': 964, 'height': 647}
+
+@asynccontextmanager
+async def task_browser_session(browser: Browser):
     """
-    temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-    temp_zip_path = temp_zip.name
-    temp_zip.close()
-
-    temp_result_path = tempfile.mktemp(suffix='.json')
-    with open(temp_result_path, 'w', encoding='utf-8') as temp_result:
-        if isinstance(result_data, str):
-            temp_result.write(result_data)
-        else:
-            json.dump(result_data, temp_result, indent=2, default=str)
+    Yield a BrowserSession backed by a fresh, isolated context of a shared browser.
 
+    The context (cookies, storage, tabs) is discarded once the task is done,
+    while the browser process itself stays up for the remaining tasks.
+    """
+    context = await browser.new_context(viewport=VIEWPORT) # type: ignore
     try:
-        with zipfile.ZipFile(temp_zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file_path in files_to_zip:
-                if not os.path.exists(file_path):
-                    raise FileNotFoundError(f"File not found: {file_path}")
-                zip_file.write(file_path, arcname=os.path.basename(file_path))
-            
-            zip_file.write(temp_result_path, arcname='result.json')
-
-        # Upload to GCS
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(destination_blob_name)
-        blob.upload_from_filename(temp_zip_path)
-
-        gcs_url = f"gs://{bucket_name}/{destination_blob_name}"
-        print(f"Zip file uploaded to {gcs_url}")
-
-        # Clean up the original files
-        for file_path in files_to_zip:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-
-        return gcs_url
-
+        yield BrowserSession(
+            browser=browser, # type: ignore
+            browser_context=context, # type: ignore
+            keep_alive=True, # type: ignore
+            viewport=VIEWPORT, # type: ignore
+        )
     finally:
-        # Clean up temp files
-        if os.path.exists(temp_zip_path):
-            os.remove(temp_zip_path)
-        if os.path.exists(temp_result_path):
-            os.remove(temp_result_path)
+        await context.close()
 
 
-def generate_screenshot_files(result_json: dict, taskId: str, model: str) -> list[str]:
-    os.makedirs(taskId, exist_ok=True)
-    screenshot_files = []
+def failed_task_result(task: dict, jobId: str, model: str, error: Exception) -> dict:
+    """Build the result entry recorded for a task that raised instead of finishing."""
+    task["model"] = model
+    return {"jobId": jobId, "task": task, "history": [], "error": str(error)}
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    for index, entry in enumerate(result_json.get("history", [])):
-        state = entry.get("state", {})
-        screenshot_b64 = state.get("screenshot")
+async def run_task(task: dict, browser_session: BrowserSession, jobId: str, model: str, store: ScreenshotStore,
+                   trajectories: TrajectoryStore | None = None) -> dict:
+    """
+    Run a single task with its own Agent and collect its result.
+
+    Screenshots are moved into the store step by step while the history is
+    serialized, so the result only references them by key.
+
+    With a trajectory store, the cached actions of an earlier successful run
+    of the same task are replayed first and the LLM only takes over from the
+    first step that no longer matches the page.
+
+    Returns:
+        dict: The result JSON of the task
+    """
+    agent = Agent(
+        browser_session=browser_session,
+        task=task["task"],
+        llm=getLLM(model),
+        use_vision=False,
+        override_system_message="""
+            CAUTION: if hit with captcha more than two times, end executing the particular tasks and go to next task.
+        """,
+        register_new_step_callback=progress.on_step
+    )
 
-        if screenshot_b64:
-            try:
-                # Decode the base64 image data
-                image_data = base64.b64decode(screenshot_b64)
+    replayed = False
+    cached_steps = await trajectories.load(task) if trajectories else None
+    if cached_steps:
+        replayed = await replay_trajectory(agent, cached_steps, task["taskId"])
+        progress.emit("replay", steps=len(agent.state.history.history), complete=replayed)
 
-                # Define the filename based on the timestamp and index
-                filename = os.path.join(taskId, f"screenshot_{timestamp}_{index+1}.png")
+    # Run the agent to get the result
+    history = agent.state.history if replayed else await agent.run()
+    progress.emit("task_end", steps=len(history.history), done=history.is_done(), success=history.is_successful())
+    task["model"] = model
+    result_json = {"history": await serialize_history(history, task["taskId"], store), "jobId": jobId, "task": task}
+    print(f"Task {task['taskId']}: {len(result_json['history'])} steps serialized, peak RSS {peak_rss_bytes() / 2**20:.1f} MiB")
+    if trajectories and not replayed and history.is_done() and history.is_successful():
+        await trajectories.save(task, result_json["history"])
+    return result_json
 
-                # Save the decoded image to a file
-                with open(filename, "wb") as f:
-                    f.write(image_data)
 
-                # Update the JSON entry with the file path
-                result_json["history"][index]["state"]["screenshot"] = filename
-                print(f"Saved screenshot {index+1} as {filename}")
-                screenshot_files.append(filename)
+async def BrowserAgent(tasks: list[dict[str, str]], bucket_name: str, jobId: str, model: str, userid:str, concurrency: int = DEFAULT_CONCURRENCY, cdp_url: str | None = None, headless: bool = True, resume: bool = False):
+    """
+    Run every task of a job and upload its results.
 
-            except Exception as e:
-                print(f"Error processing screenshot {index+1}: {e}")
-                # Ensure the screenshot field is cleared if saving fails
-                result_json["history"][index]["state"]["screenshot"] = None
-        else:
-            # Explicitly mark as no screenshot if not present
-            result_json["history"][index]["state"]["screenshot"] = None
-    
-    return screenshot_files
+    With a concurrency of 1 the tasks run one after another in a single
+    persistent browser session. A higher concurrency shares one browser
+    between the tasks, gives each task its own isolated context and lets at
+    most `concurrency` of them run at once. Either way results keep the task
+    order and a failing task does not stop the others.
 
+    When `cdp_url` points at an already running browser (the worker's pool),
+    the job connects to it instead of launching Chromium and every task gets
+    an isolated context regardless of the concurrency.
 
-async def BrowserAgent(tasks: list[dict[str, str]], bucket_name: str, jobId: str, model: str, userid:str):
-    # Create an Agent to perform the browser task
+    Each task's archive is uploaded in the background as soon as the task
+    ends, and a manifest listing all archives is written once the job is done.
+    Results reach Firestore as per-task documents, in batches, while the job runs.
+
+    Every task whose result is both committed and uploaded is checkpointed in
+    Redis; with `resume` the tasks checkpointed by an earlier attempt of the
+    job are skipped and keep their archives.
+    """
     all_results = []
     db = firestore.Client(database=os.getenv('FIRESTORE_DB', ''))
-    browser = BrowserSession(
-        headless=True, # type: ignore
-        viewport={'width': 964, 'height': 647}, # type: ignore
-        user_data_dir=f'~/.config/browseruse/profiles/{jobId}', # type: ignore
-    )
-    screenshot_files = []
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    zip_name = f"{userid}/{jobId}_result_{timestamp}.zip"
-    if browser is None:
-        return
+    # Screenshots are shared by all jobs of a user, keyed by content
+    store = ScreenshotStore(bucket_name, userid)
+    uploader = ArtifactUploader(bucket_name, f"{userid}/{jobId}_result_{timestamp}", store)
+    checkpoints = TaskCheckpoints(jobId)
+    completed = await checkpoints.load() if resume else {}
+    if completed:
+        print(f"Resuming job {jobId}: skipping {len(completed)} of {len(tasks)} completed tasks")
+    uploads: dict[str, asyncio.Task] = {}
+    trajectories = TrajectoryStore() if TRAJECTORY_REPLAY else None
+
+    def checkpoint_committed(committed: list[dict]):
+        for result in committed:
+            task_id = str(result["task"]["taskId"])
+            # Failed tasks are retried on resume
+            if not result.get("error") and task_id in uploads:
+                checkpoints.mark_when_uploaded(task_id, uploads[task_id])
+
+    results = JobResultsWriter(db, jobId, len(tasks), {"userid": userid, "model": model, "timestamp": timestamp},
+                               completed=len(completed), on_commit=checkpoint_committed)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    playwright = None
+    shared_browser = None
+
     try:
-        for i, task in enumerate(tasks):
-            agent = Agent(
-                browser_session=browser,
-                task=task["task"],
-                llm=getLLM(model),
-                use_vision=False,
-                override_system_message="""
-                    CAUTION: if hit with captcha more than two times, end executing the particular tasks and go to next task.
-                """
+        await results.start()
+        if cdp_url:
+            playwright = await async_playwright().start()
+            shared_browser = await playwright.chromium.connect_over_cdp(cdp_url)
+            session_for = lambda: task_browser_session(shared_browser) # type: ignore
+        elif concurrency > 1:
+            playwright = await async_playwright().start()
+            shared_browser = await playwright.chromium.launch(headless=headless)
+            session_for = lambda: task_browser_session(shared_browser) # type: ignore
+        else:
+            browser = BrowserSession(
+                headless=headless, # type: ignore
+                viewport=VIEWPORT, # type: ignore
+                user_data_dir=f'~/.config/browseruse/profiles/{jobId}', # type: ignore
             )
-    
-            # Run the agent to get the result
-            result = await agent.run()
-            result_json = json.loads(result.model_dump_json())
-            task["model"] = model
-            result_json["jobId"], result_json["task"] = jobId, task
-    
-            # List to store paths of saved screenshots
-            screenshot_files += generate_screenshot_files(result_json, task["taskId"], model='gpt-4o')
-            all_results.append(result_json)
-            
-            # Generate timestamp for the zip file name
-        
-        try:
-            doc_ref = db.collection("job_results").document(jobId)
-            doc_ref.set({"results": all_results, "timestamp": timestamp})
-            print(f"Results saved to Firestore under document: {jobId}")
-        except Exception as e:
-            print(f"Error saving to Firestore: {e}")
-            
-        # Upload screenshots and result to Google Cloud Storage
+            session_for = lambda: nullcontext(browser)
+
+        async def run_limited(index: int, task: dict) -> dict:
+            async with semaphore:
+                # Each gathered task has its own context, so this tags only its events
+                current_task.set(str(task.get("taskId")))
+                progress.emit("task_start", index=index, task=task.get("task"))
+                try:
+                    async with session_for() as session:
+                        result_json = await run_task(task, session, jobId, model, store, trajectories)
+                except Exception as e:
+                    print(f"Error running task {task.get('taskId')}: {e}")
+                    progress.emit("task_end", error=str(e))
+                    result_json = failed_task_result(task, jobId, model, e)
+            # Upload while the next tasks keep the LLM busy
+            uploads[str(task["taskId"])] = uploader.submit(task["taskId"], result_json)
+            await results.add(index, result_json)
+            return result_json
+
+        # gather keeps the task order regardless of completion order
+        remaining = [(index, task) for index, task in enumerate(tasks) if str(task["taskId"]) not in completed]
+        progress.emit("job_start", tasks=len(tasks), remaining=len(remaining), model=model, concurrency=concurrency)
+        all_results = await asyncio.gather(*(run_limited(index, task) for index, task in remaining))
+        await results.close()
+        progress.emit("job_end", tasks=len(tasks), failed=sum(1 for result in all_results if result.get("error")))
+
+        # Wait for the task uploads and tie them together in Google Cloud Storage
         try:
-            upload_url = zip_and_upload_to_gcs(
-                files_to_zip=screenshot_files,
-                result_data=all_results,
-                bucket_name=bucket_name,
-                destination_blob_name=zip_name
-            )
+            manifest = {
+                "jobId": jobId,
+                "userid": userid,
+                "model": model,
+                "timestamp": timestamp,
+                "screenshot_prefix": f"gs://{bucket_name}/{userid}/",
+            }
+            errors = {str(result["task"]["taskId"]): result.get("error") for result in all_results}
+            task_entries = []
+            for task in tasks:
+                task_id = str(task["taskId"])
+                if task_id in completed:
+                    # Stored by an earlier attempt
+                    task_entries.append({"taskId": task["taskId"], "error": None,
+                                         "archive": completed[task_id].get("archive"), "upload": "resumed"})
+                else:
+                    task_entries.append({"taskId": task["taskId"], "error": errors.get(task_id)})
+            if cache_stats():
+                manifest["llm_cache"] = cache_stats()
+                print(f"LLM cache: {manifest['llm_cache']}")
+            upload_url = await uploader.finish(manifest, task_entries)
             print(f"Upload successful. Files available at: {upload_url}")
+            print(f"Screenshot dedupe: {manifest['screenshots']}")
         except Exception as e:
             print(f"Error uploading to Google Cloud Storage: {e}")
+        await checkpoints.wait()
     except Exception as e:
         print(f"Error uploading to Google Cloud Storage: {e}")
+        await results.close("failed")
+    finally:
+        # For a pooled browser this only drops our contexts and disconnects
+        if shared_browser:
+            await shared_browser.close()
+        if playwright:
+            await playwright.stop()
 
 def getLLM(model: str):
-    match str(model):
-        case 'gemini-2.5-flash-preview-05-20':
-            llm = ChatGoogleGenerativeAI(
-                model="gemini-2.5-flash-preview-05-20",
-                temperature=0,
-                max_tokens=None,
-                timeout=None,
-                max_retries=2,
-                api_key=SecretStr(os.getenv("GOOGLE_API_KEY", ''))
-                # other params...
-            )
-        case 'gemini-2.5-pro-preview-05-06':
-            llm = ChatGoogleGenerativeAI(
-                model="gemini-2.5-pro-preview-05-06",
-                temperature=0,
-                max_tokens=None,
-                timeout=None,
-                max_retries=2,
-                api_key=SecretStr(os.getenv("GOOGLE_API_KEY", ''))
-                # other params...
-            )
-        case 'gpt-4o':
-            llm = ChatOpenAI(model='gpt-4o', api_key=SecretStr(os.getenv("OPENAI_API_KEY", '')))
-        case 'gpt-o1':
-            llm = ChatOpenAI(model='gpt-o1', api_key=SecretStr(os.getenv("OPENAI_API_KEY", '')))
-        case 'gpt-o3':
-            llm = ChatOpenAI(model='gpt-o3', api_key=SecretStr(os.getenv("OPENAI_API_KEY", '')))
-        case 'claude-opus-4-20250514':
-            llm = ChatAnthropic(
-                model_name="claude-opus-4-20250514",
-                api_key=SecretStr(os.getenv("ANTHROPIC_API_KEY", "")),
-                timeout=None,
-                stop=None
-            )
-        case 'claude-3-7-sonnet-latest':
-            llm = ChatAnthropic(
-                model_name="claude-3-7-sonnet-latest",
-                api_key=SecretStr(os.getenv("ANTHROPIC_API_KEY", "")),
-                timeout=None,
-                stop=None
-            )
-        case _:
-            llm = ChatGoogleGenerativeAI(
-                model="gemini-2.5-flash-preview-05-20",
-                temperature=0,
-                max_tokens=None,
-                timeout=None,
-                max_retries=2,
-                api_key=SecretStr(os.getenv("GOOGLE_API_KEY", ''))
-                # other params...
-            )
-    return llm                
+    """Chat model for `model`, shared by every task of this process (see agents/llm_models.json)."""
+    return attach_progress(get_registry().get(model))
 
-if __name__ == "__main__":
-    
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point, also called directly by forked workers."""
     parser = argparse.ArgumentParser(description="Run BrowserAgent with given parameters.")
     parser.add_argument("--jobId", required=True, help="Unique job ID")
     parser.add_argument("--tasks", required=True, help="Tasks in JSON format (e.g., '[{\"taskId\": \"1\", \"task\": \"goto netflix.com\"}]')")
     parser.add_argument("--user", required=True, help="unique user id")
     parser.add_argument("--model", type=str, required=False, help="Model used to run the agent to successful execution")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Maximum number of tasks run at the same time")
+    parser.add_argument("--headed", action="store_true", help="Run a visible browser (needs DISPLAY)")
+    parser.add_argument("--cdp-url", required=False, help="CDP endpoint of a pre-launched browser to run the tasks in")
+    parser.add_argument("--resume", action="store_true", help="Skip tasks an earlier attempt of this job completed")
+    parser.add_argument("--events-fd", type=int, required=False, help="File descriptor to write JSON-lines progress events to")
 
-    args = parser.parse_args()        
+    args = parser.parse_args(argv)
 
     # Parse tasks from JSON string
     try:
         tasks = json.loads(args.tasks)
     except json.JSONDecodeError:
         print("Error: Invalid JSON format for tasks.")
-        exit(1)
+        return 1
     
     # Run the browser agent
     """asyncio.run(BrowserAgent(
@@ -262,10 +268,23 @@ if __name__ == "__main__":
         userid="Test User"
     ))"""
 
-    asyncio.run(BrowserAgent(
-        tasks=tasks,
-        bucket_name=os.getenv("BUCKET_NAME", ''),
-        jobId=args.jobId,
-        model=args.model,
-        userid=args.user
-    ))
\ No newline at end of file
+    progress.open(args.jobId, args.events_fd)
+    try:
+        asyncio.run(BrowserAgent(
+            tasks=tasks,
+            bucket_name=os.getenv("BUCKET_NAME", ''),
+            jobId=args.jobId,
+            model=args.model,
+            userid=args.user,
+            concurrency=args.concurrency,
+            cdp_url=args.cdp_url,
+            headless=not args.headed,
+            resume=args.resume
+        ))
+    finally:
+        progress.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,74 @@
+import asyncio
+import base64
+import os
+import resource
+import sys
+
+from agents.screenshots import ScreenshotStore
+
+# Decoded screenshots of one task being stored at the same time
+SCREENSHOTS_IN_FLIGHT = int(os.getenv("SCREENSHOTS_IN_FLIGHT", "2"))
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _report_failed_saves(saves: set[asyncio.Task], task_id: str):
+    for save in saves:
+        if save.exception() is not None:
+            print(f"Error storing a screenshot of task {task_id}: {save.exception()}")
+
+
+async def serialize_history(history, task_id: str, store: ScreenshotStore,
+                            in_flight: int = SCREENSHOTS_IN_FLIGHT) -> list[dict]:
+    """
+    Turn an agent history into JSON-ready step entries, one step at a time.
+
+    Each step's base64 screenshot is detached from the history object,
+    decoded, handed to the content-addressed store and dropped; its entry
+    references the store key instead. At most `in_flight` decoded images
+    are alive at once, so memory is bounded by a step rather than by the
+    whole job, and the history is never copied as one JSON document.
+
+    Args:
+        history: The `AgentHistoryList` returned by `Agent.run()`
+        task_id (str): Task the history belongs to, for error messages
+        store (ScreenshotStore): Where new screenshots are persisted
+
+    Returns:
+        list: One dict per step, as in `history.model_dump()["history"]`
+    """
+    entries = []
+    pending: set[asyncio.Task] = set()
+
+    for index, step in enumerate(history.history):
+        screenshot_b64 = step.state.screenshot
+        step.state.screenshot = None
+        entry = step.model_dump()
+        entry["state"]["screenshot"] = None
+
+        if screenshot_b64:
+            try:
+                image_data = base64.b64decode(screenshot_b64)
+                digest, is_new = store.add(image_data)
+                entry["state"]["screenshot"] = store.key_for(digest)
+                if is_new:
+                    if len(pending) >= max(1, in_flight):
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        _report_failed_saves(done, task_id)
+                    pending.add(asyncio.create_task(store.save(digest, image_data)))
+            except Exception as e:
+                print(f"Error processing screenshot {index+1} of task {task_id}: {e}")
+            del screenshot_b64
+
+        entries.append(entry)
+
+    if pending:
+        done, _ = await asyncio.wait(pending)
+        _report_failed_saves(done, task_id)
+
+    return entries
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+# "passthrough" calls the LLM, "record" answers from the cache and stores new
+# responses, "replay" only answers from the cache and fails on a miss
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "passthrough").lower()
+LLM_CACHE_PATH = os.path.expanduser(os.getenv("LLM_CACHE_PATH", "~/.cache/neuroshift/llm_cache.sqlite"))
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "1024"))
+LLM_CACHE_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+# Eviction runs after this many new entries
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "100"))
+
+CACHE_MODES = ("passthrough", "record", "replay")
+
+# Parts of a prompt that change between otherwise identical runs
+_DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?")
+_WHITESPACE = re.compile(r"\s+")
+# Run-specific ids in a serialized message's kwargs, and lists of tool calls carrying their own
+_VOLATILE_KWARGS = ("id", "tool_call_id")
+_TOOL_CALL_LISTS = {"tool_calls", "invalid_tool_calls", "tool_call_chunks"}
+
+
+class LLMCacheMiss(Exception):
+    """Raised in replay mode for a prompt that was never recorded."""
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Canonical form of a serialized prompt: message and tool-call ids dropped,
+    timestamps masked, whitespace collapsed and keys sorted.
+
+    Only the ids that differ between runs go. The "id" of a serialized
+    constructor is the class path, which tells a HumanMessage from an
+    AIMessage or SystemMessage, and stays part of the key.
+    """
+    def clean(value, drop=()):
+        if isinstance(value, dict):
+            constructor = value.get("type") == "constructor"
+            return {
+                k: clean(v, _VOLATILE_KWARGS if constructor and k == "kwargs" else
+                         ("id",) if k in _TOOL_CALL_LISTS else ())
+                for k, v in value.items() if k not in drop
+            }
+        if isinstance(value, list):
+            # Entries of a tool call list lose their ids
+            return [clean(v, drop) for v in value]
+        if isinstance(value, str):
+            return _WHITESPACE.sub(" ", _DATETIME.sub("<datetime>", value)).strip()
+        return value
+
+    try:
+        return json.dumps(clean(json.loads(prompt)), sort_keys=True)
+    except ValueError:
+        return clean(prompt)
+
+
+class LLMResponseStore:
+    """
+    SQLite file of LLM responses shared by every cached model and process.
+
+    Entries older than `max_age_days` are dropped, then the least recently
+    used ones until the file holds at most `max_mb` of responses.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_mb: int = LLM_CACHE_MAX_MB,
+                 max_age_days: float = LLM_CACHE_MAX_AGE_DAYS, evict_every: int = LLM_CACHE_EVICT_EVERY):
+        self.path = path
+        self.max_bytes = max_mb * 1024 * 1024
+        self.max_age = max_age_days * 24 * 3600
+        self.evict_every = max(1, evict_every)
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, value TEXT, size INTEGER, created REAL, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age and row[1] < time.time() - self.max_age):
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, model: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, len(value.encode("utf-8")), now, now)
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        if self.max_age:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        keys = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", keys)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+
+class LLMCache(BaseCache):
+    """
+    Record/replay cache of one model, set as the chat model's `cache`.
+
+    Keys are the SHA-256 of the model name, langchain's description of the
+    model and its bound tools (`llm_string`) and the normalized prompt, so
+    only deterministic, temperature-0 models should be cached.
+    """
+
+    def __init__(self, store: LLMResponseStore, model: str, mode: str = LLM_CACHE_MODE):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode}")
+        self.store = store
+        self.model = model
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        material = "\0".join((self.model, llm_string, normalize_prompt(prompt)))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self.mode == "passthrough":
+            return None
+        value = self.store.get(self._key(prompt, llm_string))
+        if value is None:
+            self.misses += 1
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"No recorded response of {self.model} for this prompt")
+            return None
+        self.hits += 1
+        return loads(value)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.mode == "record":
+            self.store.put(self._key(prompt, llm_string), self.model, dumps(list(return_val)))
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+_store: LLMResponseStore | None = None
+_caches: dict[str, LLMCache] = {}
+
+
+def cache_for(model: str, mode: str = LLM_CACHE_MODE) -> LLMCache | None:
+    """The cache of `model` in this process, or None in passthrough mode."""
+    global _store
+    if mode == "passthrough":
+        return None
+    if model not in _caches:
+        if _store is None:
+            _store = LLMResponseStore()
+        _caches[model] = LLMCache(_store, model, mode)
+    return _caches[model]
+
+
+def cache_stats() -> dict[str, dict]:
+    """Hit rates of this process's caches, per model."""
+    return {model: cache.stats() for model, cache in _caches.items()}
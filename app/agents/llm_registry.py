@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+
+import httpx
+from langchain_anthropic import ChatAnthropic
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_openai import ChatOpenAI
+from pydantic import SecretStr
+
+from agents.llm_cache import cache_for
+
+# JSON file describing the models jobs may ask for
+LLM_REGISTRY_PATH = os.getenv("LLM_REGISTRY_PATH", os.path.join(os.path.dirname(__file__), "llm_models.json"))
+# Seconds a single LLM request may take, and to establish its connection
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+# Environment variable holding the API key of each provider
+API_KEY_ENV = {
+    "openai": "OPENAI_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+    "google": "GOOGLE_API_KEY",
+}
+
+
+def _api_key(spec: dict) -> SecretStr:
+    return SecretStr(os.getenv(spec.get("api_key_env", API_KEY_ENV[spec["provider"]]), ""))
+
+
+class ModelRegistry:
+    """
+    Builds chat models from a JSON config and reuses them.
+
+    The config maps the model names jobs use to a provider, the provider's
+    model id and extra constructor params:
+
+        {"default": "gpt-4o",
+         "models": {"gpt-4o": {"provider": "openai", "model": "gpt-4o", "params": {}}}}
+
+    One client is kept per (provider, model, params), so every task of a
+    process talks to the provider over the same keep-alive connections
+    instead of paying for new TLS handshakes. Requests get explicit timeouts.
+    Unless LLM_CACHE_MODE is "passthrough", each model answers through its
+    record/replay cache (see agents/llm_cache.py).
+
+    Clients bind their connection pools to the event loop they first run on;
+    build them inside the job, not in a process that later forks.
+    """
+
+    def __init__(self, config: dict, timeout: float = LLM_TIMEOUT, connect_timeout: float = LLM_CONNECT_TIMEOUT,
+                 max_connections: int = LLM_MAX_CONNECTIONS):
+        self.models: dict[str, dict] = config.get("models", {})
+        self.default = config.get("default")
+        if self.default not in self.models:
+            raise ValueError(f"Default model {self.default!r} is not in the registry")
+        for name, spec in self.models.items():
+            if spec.get("provider") not in API_KEY_ENV:
+                raise ValueError(f"Model {name!r} has an unknown provider: {spec.get('provider')!r}")
+        self.timeout = timeout
+        self._http_timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._http_limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._clients: dict[tuple, object] = {}
+        self._http_clients: dict[str, tuple[httpx.Client, httpx.AsyncClient]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str = LLM_REGISTRY_PATH, **kwargs) -> "ModelRegistry":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def spec(self, name: str) -> dict:
+        """Config of `name`, or of the default model for names the registry does not know."""
+        return self.models.get(str(name)) or self.models[self.default]
+
+    def get(self, name: str):
+        """The shared chat model for `name`, built on first use."""
+        spec = self.spec(name)
+        params = spec.get("params", {})
+        key = (spec["provider"], spec["model"], json.dumps(params, sort_keys=True))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._build(spec, params)
+                self._clients[key] = client
+        return client
+
+    def _http(self, provider: str) -> tuple[httpx.Client, httpx.AsyncClient]:
+        """Keep-alive HTTP pools shared by every model of one provider."""
+        if provider not in self._http_clients:
+            options = {"timeout": self._http_timeout, "limits": self._http_limits}
+            self._http_clients[provider] = (httpx.Client(**options), httpx.AsyncClient(**options))
+        return self._http_clients[provider]
+
+    def _build(self, spec: dict, params: dict):
+        provider = spec["provider"]
+        if provider == "openai":
+            http_client, http_async_client = self._http(provider)
+            return ChatOpenAI(
+                model=spec["model"],
+                api_key=_api_key(spec),
+                timeout=self.timeout,
+                cache=cache_for(spec["model"]),
+                http_client=http_client,
+                http_async_client=http_async_client,
+                **params
+            )
+        if provider == "anthropic":
+            # The Anthropic SDK keeps its own pool per client, reused with the client
+            return ChatAnthropic(
+                model_name=spec["model"],
+                api_key=_api_key(spec),
+                timeout=self.timeout,
+                cache=cache_for(spec["model"]),
+                **params
+            )
+        # The Gemini client keeps its channel open for as long as it is reused
+        return ChatGoogleGenerativeAI(
+            model=spec["model"],
+            api_key=_api_key(spec),
+            timeout=self.timeout,
+            cache=cache_for(spec["model"]),
+            **params
+        )
+
+
+_registry: ModelRegistry | None = None
+
+
+def get_registry() -> ModelRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry.from_file()
+    return _registry
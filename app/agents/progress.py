@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Task the current coroutine works on, so shared callbacks know whom an event belongs to
+current_task: ContextVar[str | None] = ContextVar("current_task", default=None)
+
+
+class ProgressEmitter:
+    """
+    Writes structured progress events as JSON lines to a file descriptor.
+
+    The worker passes the write end of a pipe with --events-fd and relays
+    every line to the job's progress channel, so progress never has to be
+    scraped from the log. Without a descriptor, events are dropped.
+
+    Every event carries "event", "jobId", "ts" and, inside a task, "taskId".
+    """
+
+    def __init__(self):
+        self.job_id: str | None = None
+        self._stream = None
+        self._lock = threading.Lock()
+
+    def open(self, job_id: str, fd: int | None):
+        self.job_id = job_id
+        if fd is not None:
+            self._stream = os.fdopen(fd, "w", buffering=1, encoding="utf-8")
+
+    @property
+    def enabled(self) -> bool:
+        return self._stream is not None
+
+    def emit(self, event: str, **fields):
+        if self._stream is None:
+            return
+        record = {"event": event, "jobId": self.job_id, "ts": round(time.time(), 3)}
+        task_id = current_task.get()
+        if task_id is not None:
+            record["taskId"] = task_id
+        record.update(fields)
+        line = json.dumps(record, default=str)
+        with self._lock:
+            try:
+                self._stream.write(line + "\n")
+            except (BrokenPipeError, OSError, ValueError):
+                # Nobody listens any more; the job itself must go on
+                self._stream = None
+
+    def on_step(self, state, model_output, step_number: int):
+        """`register_new_step_callback` of browser_use's Agent: the LLM chose the next actions."""
+        actions = [name for action in model_output.action for name in action.model_dump(exclude_unset=True)]
+        self.emit(
+            "step",
+            step=step_number,
+            actions=actions,
+            url=getattr(state, "url", None),
+            goal=getattr(model_output.current_state, "next_goal", None),
+        )
+
+    def close(self):
+        with self._lock:
+            if self._stream is not None:
+                try:
+                    self._stream.close()
+                except OSError:
+                    pass
+                self._stream = None
+
+
+class ProgressCallback(BaseCallbackHandler):
+    """Reports the latency and token usage of every LLM call as an "llm" event."""
+
+    # Run in the caller's context so `current_task` is the calling task's
+    run_inline = True
+
+    def __init__(self, emitter: ProgressEmitter):
+        self.emitter = emitter
+        self._calls: dict = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        self._calls[run_id] = (time.perf_counter(), params.get("model") or params.get("model_name"))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, **kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started, model = self._calls.pop(run_id, (None, None))
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    usage = {
+                        "input_tokens": metadata.get("input_tokens"),
+                        "output_tokens": metadata.get("output_tokens"),
+                        "total_tokens": metadata.get("total_tokens"),
+                    }
+        if not usage and response.llm_output:
+            token_usage = response.llm_output.get("token_usage") or response.llm_output.get("usage") or {}
+            usage = {
+                "input_tokens": token_usage.get("prompt_tokens") or token_usage.get("input_tokens"),
+                "output_tokens": token_usage.get("completion_tokens") or token_usage.get("output_tokens"),
+                "total_tokens": token_usage.get("total_tokens"),
+            }
+        latency = round((time.perf_counter() - started) * 1000) if started else None
+        self.emitter.emit("llm", model=model, latency_ms=latency, **usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started, model = self._calls.pop(run_id, (None, None))
+        latency = round((time.perf_counter() - started) * 1000) if started else None
+        self.emitter.emit("llm_error", model=model, latency_ms=latency, error=str(error))
+
+
+# One emitter per agent process
+progress = ProgressEmitter()
+
+
+def attach_progress(llm):
+    """Add the progress callback to a (shared) chat model once."""
+    if not progress.enabled:
+        return llm
+    callbacks = list(llm.callbacks or [])
+    if not any(isinstance(callback, ProgressCallback) for callback in callbacks):
+        llm.callbacks = callbacks + [ProgressCallback(progress)]
+    return llm
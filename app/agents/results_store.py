@@ -0,0 +1,150 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Callable
+
+# Task documents committed together, Firestore allows up to 500 writes per batch
+FIRESTORE_BATCH_SIZE = int(os.getenv("FIRESTORE_BATCH_SIZE", "5"))
+# A finished task waits at most this long for others to share its commit;
+# a timer commits whatever is buffered when it runs out
+FIRESTORE_FLUSH_SECONDS = float(os.getenv("FIRESTORE_FLUSH_SECONDS", "5"))
+
+
+class JobResultsWriter:
+    """
+    Writes a job's results to Firestore incrementally, one document per task.
+
+    Layout:
+        job_results/{jobId}                  summary: status, total, completed, failed
+        job_results/{jobId}/tasks/{taskId}   the task's result JSON and its index
+
+    Finished tasks are buffered and committed in one batched write together
+    with the updated summary, once `batch_size` tasks are waiting or the
+    oldest of them has waited `flush_seconds`; a timer started with the
+    first buffered task commits them even if no other task finishes. A crash
+    therefore loses at most the tasks of one batch, and no document grows
+    with the size of the job.
+
+    `on_commit` is called with the results of every committed batch, and
+    `completed` counts tasks an earlier attempt already stored.
+
+    `db` is a `firestore.Client`; the emulator works through
+    FIRESTORE_EMULATOR_HOST, and any object exposing `collection()`,
+    `document()` and `batch()` with `set()`/`commit()` can stand in for it.
+    """
+
+    def __init__(self, db, job_id: str, total: int, summary: dict | None = None,
+                 batch_size: int = FIRESTORE_BATCH_SIZE, flush_seconds: float = FIRESTORE_FLUSH_SECONDS,
+                 completed: int = 0, on_commit: Callable[[list[dict]], None] | None = None):
+        self.db = db
+        self.job_id = job_id
+        self.total = total
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self._summary = {"jobId": job_id, **(summary or {})}
+        self._job_ref = db.collection("job_results").document(job_id)
+        self._pending: list[tuple[int, dict]] = []
+        self._completed = completed
+        self._failed = 0
+        self._on_commit = on_commit
+        self._commits = 0
+        self._last_commit = time.monotonic()
+        self._lock = asyncio.Lock()
+        # The timer only schedules a flush; a flush it started is awaited, never cancelled
+        self._timer: asyncio.TimerHandle | None = None
+        self._timed_flush: asyncio.Task | None = None
+
+    def _summary_update(self, status: str) -> dict:
+        return {
+            "status": status,
+            "total": self.total,
+            "completed": self._completed,
+            "failed": self._failed,
+            "updated_at": datetime.now().isoformat(),
+        }
+
+    async def start(self):
+        """Create the summary document in the "running" state."""
+        await self._commit([], {**self._summary, **self._summary_update("running")}, merge=False)
+
+    async def add(self, index: int, result_json: dict):
+        """Buffer the result of a finished task and commit if the batch is due."""
+        self._pending.append((index, result_json))
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_commit >= self.flush_seconds:
+            await self.flush()
+        if self._pending:
+            self._arm_timer()
+
+    def _arm_timer(self):
+        """Commit the buffered tasks once the first of them has waited `flush_seconds`."""
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_seconds, self._timer_fired)
+
+    def _timer_fired(self):
+        self._timer = None
+        if self._timed_flush is None or self._timed_flush.done():
+            self._timed_flush = asyncio.create_task(self._flush_timed())
+
+    async def _flush_timed(self):
+        if self._pending and not await self.flush() and self._pending:
+            # Firestore is failing, try again after another interval
+            self._arm_timer()
+
+    def _cancel_timer(self):
+        """Drop a timer that has not fired yet."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def flush(self, status: str = "running") -> bool:
+        """Commit the buffered task documents and the summary. Returns False if the commit failed."""
+        async with self._lock:
+            pending, self._pending = self._pending, []
+            completed, failed = self._completed, self._failed
+            self._completed += len(pending)
+            self._failed += sum(1 for _, result in pending if result.get("error"))
+            try:
+                committed = await self._commit(pending, self._summary_update(status), merge=True)
+            except asyncio.CancelledError:
+                # Not known to be saved; keep them for close() or a later flush
+                self._pending = pending + self._pending
+                self._completed, self._failed = completed, failed
+                raise
+            if committed:
+                if not self._pending:
+                    self._cancel_timer()
+                if self._on_commit and pending:
+                    self._on_commit([result for _, result in pending])
+                return True
+            # Keep them for the next attempt
+            self._pending = pending + self._pending
+            self._completed, self._failed = completed, failed
+            return False
+
+    async def close(self, status: str = "completed"):
+        """Commit whatever is left and record the final status of the job."""
+        self._cancel_timer()
+        if self._timed_flush is not None and not self._timed_flush.done():
+            # Let a commit already under way finish rather than lose its tasks
+            await asyncio.wait([self._timed_flush])
+            self._cancel_timer()
+        if not await self.flush(status):
+            print(f"{len(self._pending)} task results of job {self.job_id} could not be saved to Firestore")
+        print(f"Results of {self._completed}/{self.total} tasks saved to Firestore "
+              f"under job_results/{self.job_id} in {self._commits} commits")
+
+    async def _commit(self, tasks: list[tuple[int, dict]], summary: dict, merge: bool) -> bool:
+        batch = self.db.batch()
+        for index, result_json in tasks:
+            task_id = str(result_json["task"]["taskId"])
+            batch.set(self._job_ref.collection("tasks").document(task_id), {"index": index, **result_json})
+        batch.set(self._job_ref, summary, merge=merge)
+        try:
+            await asyncio.to_thread(batch.commit)
+        except Exception as e:
+            print(f"Error saving results of job {self.job_id} to Firestore: {e}")
+            return False
+        self._commits += 1
+        self._last_commit = time.monotonic()
+        return True
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud import storage
+from PIL import Image
+
+# Local directory mirroring the content-addressed store, set empty to keep screenshots only in the bucket
+SCREENSHOT_DIR = os.path.expanduser(os.getenv("SCREENSHOT_DIR", "~/.cache/neuroshift/screenshots"))
+# Stored format of screenshots; "png" keeps the agent's images untouched
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "png").lower()
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+# Width of thumbnails stored next to each screenshot, 0 disables them
+SCREENSHOT_THUMBNAIL_WIDTH = int(os.getenv("SCREENSHOT_THUMBNAIL_WIDTH", "0"))
+SCREENSHOT_WORKERS = int(os.getenv("SCREENSHOT_WORKERS", "0")) or os.cpu_count() or 1
+
+# format -> (Pillow format, file extension, content type)
+FORMATS = {
+    "png": ("PNG", "png", "image/png"),
+    "webp": ("WEBP", "webp", "image/webp"),
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+}
+
+_transcode_pool: ProcessPoolExecutor | None = None
+
+
+def transcode_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all transcoding in this process, created on first use."""
+    global _transcode_pool
+    if _transcode_pool is None:
+        # forkserver children start clean instead of inheriting the agent's threads
+        _transcode_pool = ProcessPoolExecutor(
+            max_workers=SCREENSHOT_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver")
+        )
+    return _transcode_pool
+
+
+def _encode(image: Image.Image, image_format: str, quality: int) -> bytes:
+    pil_format = FORMATS[image_format][0]
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    if pil_format == "PNG":
+        image.save(output, format=pil_format, optimize=True)
+    elif pil_format == "WEBP":
+        image.save(output, format=pil_format, quality=quality, method=4)
+    else:
+        image.save(output, format=pil_format, quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def transcode_screenshot(data: bytes, image_format: str = SCREENSHOT_FORMAT, quality: int = SCREENSHOT_QUALITY,
+                         thumbnail_width: int = SCREENSHOT_THUMBNAIL_WIDTH) -> tuple[bytes, bytes | None]:
+    """
+    Re-encode a PNG screenshot and optionally build a thumbnail of it.
+
+    Runs inside the transcode process pool, so it only takes and returns bytes.
+
+    Returns:
+        tuple: The encoded image, and the encoded thumbnail or None
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        encoded = data if image_format == "png" else _encode(image, image_format, quality)
+        thumbnail = None
+        if thumbnail_width and image.width > thumbnail_width:
+            height = max(1, round(image.height * thumbnail_width / image.width))
+            thumbnail = _encode(image.resize((thumbnail_width, height), Image.Resampling.LANCZOS), image_format, quality)
+    return encoded, thumbnail
+
+
+class ScreenshotStore:
+    """
+    Content-addressed screenshot storage.
+
+    Every decoded image is keyed by its SHA-256 and kept once, under
+    `screenshots/<sha256>.<ext>`: in the bucket below `prefix` and, when
+    `local_dir` is set, on local disk. History entries reference that key, so
+    identical frames within a job, and across jobs of the same prefix, are
+    neither stored nor uploaded twice.
+
+    New images may be transcoded to `image_format` and get a thumbnail
+    (`<sha256>.thumb.<ext>`) on the way; the digest is always that of the
+    original PNG, so duplicates are recognised before any encoding work.
+    """
+
+    def __init__(self, bucket_name: str, prefix: str, storage_client=None, local_dir: str = SCREENSHOT_DIR,
+                 image_format: str = SCREENSHOT_FORMAT, quality: int = SCREENSHOT_QUALITY,
+                 thumbnail_width: int = SCREENSHOT_THUMBNAIL_WIDTH):
+        if image_format not in FORMATS:
+            raise ValueError(f"Unsupported screenshot format: {image_format}")
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.local_dir = local_dir
+        self.image_format = image_format
+        self.quality = quality
+        self.thumbnail_width = thumbnail_width
+        self.extension = FORMATS[image_format][1]
+        self.content_type = FORMATS[image_format][2]
+        self._storage_client = storage_client
+        self._seen: set[str] = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "screenshots": 0,
+            "unique": 0,
+            "already_stored": 0,
+            "bytes_total": 0,
+            "bytes_encoded": 0,
+            "bytes_stored": 0,
+            "encode_seconds": 0.0,
+        }
+
+    def key_for(self, digest: str, thumbnail: bool = False) -> str:
+        variant = ".thumb" if thumbnail else ""
+        return f"screenshots/{digest}{variant}.{self.extension}"
+
+    def _client(self):
+        if self._storage_client is None:
+            self._storage_client = storage.Client()
+        return self._storage_client
+
+    def add(self, data: bytes) -> tuple[str, bool]:
+        """
+        Register an image.
+
+        An image counts as known from here on; if its `save` fails it is
+        forgotten again, so a later duplicate is persisted instead.
+
+        Returns:
+            tuple: Its digest, and whether it is new to this store and must be persisted
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._stats["screenshots"] += 1
+            self._stats["bytes_total"] += len(data)
+            if digest in self._seen:
+                return digest, False
+            self._seen.add(digest)
+            self._stats["unique"] += 1
+        return digest, True
+
+    def _write(self, key: str, data: bytes) -> bool:
+        """Write one object locally and/or to the bucket unless it is already there. Blocking."""
+        stored = False
+
+        if self.local_dir:
+            path = os.path.join(self.local_dir, key)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+                stored = True
+
+        if self.bucket_name:
+            blob = self._client().bucket(self.bucket_name).blob(f"{self.prefix}/{key}")
+            # A metadata lookup is far cheaper than re-sending an image an earlier job uploaded
+            if not blob.exists():
+                try:
+                    blob.upload_from_string(data, content_type=self.content_type, if_generation_match=0)
+                    stored = True
+                except PreconditionFailed:
+                    pass
+
+        return stored
+
+    async def save(self, digest: str, data: bytes):
+        """
+        Transcode a new image in the process pool, then persist it and its thumbnail.
+
+        Neither step runs on the event loop, so the agent keeps working meanwhile.
+        """
+        try:
+            await self._save(digest, data)
+        except BaseException:
+            with self._lock:
+                self._seen.discard(digest)
+                self._stats["unique"] -= 1
+            raise
+
+    async def _save(self, digest: str, data: bytes):
+        thumbnail = None
+        if self.image_format != "png" or self.thumbnail_width:
+            started = time.perf_counter()
+            data, thumbnail = await asyncio.get_running_loop().run_in_executor(
+                transcode_pool(), transcode_screenshot, data, self.image_format, self.quality, self.thumbnail_width
+            )
+            with self._lock:
+                self._stats["encode_seconds"] += time.perf_counter() - started
+
+        stored = await asyncio.to_thread(self._write, self.key_for(digest), data)
+        if thumbnail is not None:
+            await asyncio.to_thread(self._write, self.key_for(digest, thumbnail=True), thumbnail)
+
+        with self._lock:
+            self._stats["bytes_encoded"] += len(data)
+            if stored:
+                self._stats["bytes_stored"] += len(data)
+            else:
+                self._stats["already_stored"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["screenshots"]
+        stats["dedupe_ratio"] = round(1 - stats["unique"] / total, 3) if total else 0.0
+        stats["bytes_saved"] = stats["bytes_total"] - stats["bytes_stored"]
+        stats["encode_seconds"] = round(stats["encode_seconds"], 3)
+        return stats
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import re
+from urllib.parse import urlsplit
+
+from browser_use.agent.views import AgentHistory, AgentHistoryList
+from browser_use.browser.views import BrowserStateHistory
+
+from utils.redis_client import get_redis
+
+# Replay cached action trajectories before asking the LLM
+TRAJECTORY_REPLAY = os.getenv("TRAJECTORY_REPLAY", "0") == "1"
+TRAJECTORY_TTL = int(os.getenv("TRAJECTORY_TTL", str(30 * 24 * 3600)))
+# Seconds to let the page settle after each replayed step
+TRAJECTORY_STEP_DELAY = float(os.getenv("TRAJECTORY_STEP_DELAY", "1.0"))
+
+_URL = re.compile(r"https?://[^\s'\"<>]+|\b(?:[a-z0-9-]+\.)+[a-z]{2,}(?:/[^\s'\"<>]*)?", re.IGNORECASE)
+_BLANK_URLS = ("", "about:blank", "chrome://newtab/", "chrome://new-tab-page/")
+
+
+def normalize_task(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def start_url(task: dict) -> str:
+    """URL a task starts from: its `startUrl`/`url` field, else the first URL in its text."""
+    url = task.get("startUrl") or task.get("url")
+    if not url:
+        match = _URL.search(task.get("task", ""))
+        url = match.group(0) if match else ""
+    return url.rstrip("/").lower()
+
+
+def _same_page(current: str, recorded: str) -> bool:
+    current, recorded = urlsplit(current), urlsplit(recorded)
+    return (current.netloc, current.path.rstrip("/")) == (recorded.netloc, recorded.path.rstrip("/"))
+
+
+class TrajectoryStore:
+    """
+    Action trajectories of successful tasks, in Redis under `trajectory:<sha256>`.
+
+    Keys hash the normalized task text and its start URL; values are the
+    task's serialized history entries without screenshots.
+    """
+
+    def __init__(self, redis=None, ttl: int = TRAJECTORY_TTL):
+        self.ttl = ttl
+        self._redis = redis
+
+    def _client(self):
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    @staticmethod
+    def key_for(task: dict) -> str:
+        material = f"{normalize_task(task.get('task', ''))}\0{start_url(task)}"
+        return f"trajectory:{hashlib.sha256(material.encode('utf-8')).hexdigest()}"
+
+    async def load(self, task: dict) -> list[dict] | None:
+        try:
+            value = await self._client().get(self.key_for(task))
+        except Exception as e:
+            print(f"Error loading trajectory of task {task.get('taskId')}: {e}")
+            return None
+        return json.loads(value) if value else None
+
+    async def save(self, task: dict, entries: list[dict]):
+        steps = [{**entry, "state": {**entry["state"], "screenshot": None}} for entry in entries]
+        try:
+            await self._client().set(self.key_for(task), json.dumps(steps, default=str), ex=self.ttl)
+        except Exception as e:
+            print(f"Error saving trajectory of task {task.get('taskId')}: {e}")
+
+
+def load_history(agent, entries: list[dict]) -> AgentHistoryList:
+    """Rebuild a history with the agent's own action models, like `AgentHistoryList.load_from_file`."""
+    steps = []
+    for entry in entries:
+        entry = {**entry, "state": dict(entry["state"])}
+        if isinstance(entry.get("model_output"), dict):
+            entry["model_output"] = agent.AgentOutput.model_validate(entry["model_output"])
+        else:
+            entry["model_output"] = None
+        entry["state"].setdefault("interacted_element", None)
+        steps.append(entry)
+    return AgentHistoryList.model_validate({"history": steps})
+
+
+async def replay_trajectory(agent, entries: list[dict], task_id: str, delay: float = TRAJECTORY_STEP_DELAY) -> bool:
+    """
+    Replay a recorded trajectory in the agent's browser without calling the LLM.
+
+    Before each step the current page must match the recorded one, and every
+    element the step acted on must be found again in the live DOM (browser_use
+    matches it by its xpath, attributes and parent branch). Replayed steps are
+    appended to the agent's history; at the first step that fails to validate
+    the replay stops so `agent.run()` can continue from the current page.
+
+    Returns:
+        bool: True if the replay reached the trajectory's final "done" action
+    """
+    try:
+        history = load_history(agent, entries)
+    except Exception as e:
+        print(f"Task {task_id}: cached trajectory is unusable: {e}")
+        return False
+
+    for index, step in enumerate(history.history):
+        if not step.model_output or not step.model_output.action:
+            continue
+        try:
+            page = await agent.browser_session.get_current_page()
+            if step.state.url not in _BLANK_URLS and not _same_page(page.url, step.state.url):
+                print(f"Task {task_id}: replay stopped at step {index+1}, on {page.url} instead of {step.state.url}")
+                return False
+            results = await agent._execute_history_step(step, delay)
+            page = await agent.browser_session.get_current_page()
+            title = await page.title()
+        except Exception as e:
+            print(f"Task {task_id}: replay stopped at step {index+1}: {e}")
+            return False
+
+        agent.state.n_steps += 1
+        agent.state.last_result = results
+        agent.state.history.history.append(AgentHistory(
+            model_output=step.model_output,
+            result=results,
+            state=BrowserStateHistory(
+                url=page.url,
+                title=title,
+                tabs=[],
+                interacted_element=step.state.interacted_element,
+                screenshot=None,
+            ),
+            metadata=None,
+        ))
+        if any(result.is_done for result in results):
+            print(f"Task {task_id}: replayed all {index+1} cached steps without the LLM")
+            return True
+
+    return False
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import os
+
+from google.cloud import storage
+
+from agents.archive import zip_and_upload_to_gcs
+from agents.screenshots import ScreenshotStore
+
+# Task archives uploaded at the same time
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+
+
+class ArtifactUploader:
+    """
+    Uploads each task's archive in the background as soon as the task finishes.
+
+    Uploads run in threads, at most `concurrency` at once, so they overlap
+    with the LLM work of the tasks still running. `finish()` waits for all of
+    them and writes a small manifest that ties the job's archives together.
+
+    Objects are laid out as `{prefix}/{taskId}.zip` and `{prefix}/manifest.json`.
+    Screenshots are already in the content-addressed `store`, whose statistics
+    end up in the manifest; the archives only hold result.json.
+    """
+
+    def __init__(self, bucket_name: str, prefix: str, store: ScreenshotStore, storage_client=None,
+                 concurrency: int = UPLOAD_CONCURRENCY):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.store = store
+        self._storage_client = storage_client
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._uploads: dict[str, asyncio.Task] = {}
+
+    def _client(self):
+        if self._storage_client is None:
+            self._storage_client = storage.Client()
+        return self._storage_client
+
+    def submit(self, task_id: str, result_json: dict) -> asyncio.Task:
+        """Queue the archive of one finished task for upload."""
+        upload = asyncio.create_task(self._upload(task_id, result_json))
+        self._uploads[task_id] = upload
+        return upload
+
+    async def _upload(self, task_id: str, result_json: dict) -> dict:
+        blob_name = f"{self.prefix}/{task_id}.zip"
+        async with self._semaphore:
+            try:
+                url = await asyncio.to_thread(
+                    lambda: zip_and_upload_to_gcs([], result_json, self.bucket_name, blob_name, self._client())
+                )
+                return {"archive": url, "upload": "uploaded"}
+            except Exception as e:
+                print(f"Error uploading artifacts of task {task_id}: {e}")
+                return {"archive": None, "upload": "failed", "upload_error": str(e)}
+
+    async def finish(self, manifest: dict, task_entries: list[dict]) -> str:
+        """
+        Wait for every upload, then store the manifest.
+
+        Args:
+            manifest (dict): Job level fields of the manifest
+            task_entries (list): One dict with a "taskId" per task, in task order;
+                each is completed with the location and outcome of its upload,
+                unless the entry already carries them
+
+        Returns:
+            str: URL of the uploaded manifest
+        """
+        uploads = {task_id: await upload for task_id, upload in self._uploads.items()}
+        manifest["tasks"] = [
+            {"archive": None, "upload": "missing", **entry, **uploads.get(entry["taskId"], {})}
+            for entry in task_entries
+        ]
+        manifest["screenshots"] = self.store.stats()
+        blob_name = f"{self.prefix}/manifest.json"
+
+        def upload_manifest():
+            blob = self._client().bucket(self.bucket_name).blob(blob_name)
+            blob.upload_from_string(json.dumps(manifest, indent=2, default=str), content_type="application/json")
+
+        await asyncio.to_thread(upload_manifest)
+        url = f"gs://{self.bucket_name}/{blob_name}"
+        print(f"Manifest uploaded to {url}")
+        return url
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Agent startup benchmark - compares a cold `python -m agents.browseruse`
+interpreter with a job forked from the worker's warm, pre-imported zygote.
+
+Both variants are timed from the moment the job is started until the
+agent's first step: the agent module is imported, a headless browser is
+launched, and the LLM has chosen the first actions of --task, which is
+when `register_new_step_callback` fires. The LLM call is part of both, so
+it needs the model's API key and the difference is the startup saved.
+
+Run from the app directory:
+    python -m bench.agent_startup --runs 5 --model gpt-4o
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from utils.agent_runner import ForkedAgentProcess, preload_agent
+
+FIRST_STEP = "AGENT_FIRST_STEP"
+
+
+def agent_first_step(model: str, task: str) -> int:
+    """Run `task` for one step in a fresh browser, reporting when the step callback fires."""
+    import asyncio
+
+    from browser_use import Agent
+    from playwright.async_api import async_playwright
+
+    from agents.browseruse import getLLM, task_browser_session
+
+    steps = []
+
+    def on_step(state, model_output, step_number: int):
+        if not steps:
+            print(FIRST_STEP, flush=True)
+        steps.append(step_number)
+
+    async def run():
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(headless=True)
+            try:
+                async with task_browser_session(browser) as browser_session:
+                    agent = Agent(browser_session=browser_session, task=task, llm=getLLM(model), use_vision=False,
+                                  register_new_step_callback=on_step)
+                    await agent.run(max_steps=1)
+            finally:
+                await browser.close()
+
+    asyncio.run(run())
+    return 0
+
+
+def noop() -> int:
+    return 0
+
+
+def wait_first_step(stream) -> None:
+    for line in stream:
+        if line.strip() == FIRST_STEP:
+            return
+    raise RuntimeError("Agent exited before its first step")
+
+
+def time_cold(model: str, task: str) -> float:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c",
+         f"from bench.agent_startup import agent_first_step; agent_first_step({model!r}, {task!r})"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True
+    )
+    wait_first_step(process.stdout)
+    elapsed = time.perf_counter() - started
+    process.wait()
+    return elapsed
+
+
+def time_warm(model: str, task: str) -> float:
+    started = time.perf_counter()
+    process = ForkedAgentProcess(agent_first_step, (model, task))
+    wait_first_step(process.stdout)
+    elapsed = time.perf_counter() - started
+    process.wait()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cold subprocess and warm zygote agent startup")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs per mode")
+    parser.add_argument("--model", default="gpt-4o", help="Model the agent runs with")
+    parser.add_argument("--task", default="Open https://example.com and report the page heading",
+                        help="Task whose first step is awaited")
+    args = parser.parse_args()
+
+    cold = [time_cold(args.model, args.task) for _ in range(args.runs)]
+
+    preload_started = time.perf_counter()
+    preload_agent()
+    # The zygote imports in the background; its first child waits for that
+    ForkedAgentProcess(noop).wait()
+    preload = time.perf_counter() - preload_started
+    warm = [time_warm(args.model, args.task) for _ in range(args.runs)]
+
+    print(f"one-time zygote start in worker: {preload:.3f}s")
+    for name, samples in (("cold subprocess", cold), ("warm zygote", warm)):
+        print(f"{name:>16}: median {statistics.median(samples):.3f}s  min {min(samples):.3f}s  max {max(samples):.3f}s")
+    print(f"speedup: {statistics.median(cold) / statistics.median(warm):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Frame extraction benchmark - time to extract click screenshots from a screen
+recording by seeking to every timestamp versus the single sequential pass and
+the parallel mode (worker processes plus threaded PNG writes) of
+`VideoFrameExtractor`.
+
+Renders a synthetic screen recording - a mostly static page with a moving
+element and the frame number burnt in - and bursts of clicks across it, then
+extracts the same timestamps by seeking, sequentially (once per --seek-gap)
+and in parallel, and checks that every run wrote identical frames.
+
+Run from the app directory:
+    python -m bench.frame_extraction --seconds 120 --clicks 60 --seek-gap 0.5 1 5 --workers 4
+"""
+
+import argparse
+import filecmp
+import os
+import random
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from screenshot.generate import (FRAME_EXTRACTION_WORKERS, FRAME_SEEK_GAP_SECONDS, FRAME_WRITE_THREADS,
+                                 TimestampExtractor, VideoFrameExtractor)
+
+SIZE = (1280, 720)
+WORDS = "agent browser click search result page login submit account price order cart news"
+
+
+def synthetic_video(path: str, seconds: int, fps: int) -> int:
+    """Write a recording with the frame number burnt in. Returns the frame count."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, SIZE)
+    background = np.full((SIZE[1], SIZE[0], 3), 245, dtype=np.uint8)
+    cv2.rectangle(background, (0, 0), (SIZE[0], 60), (40, 40, 40), -1)
+    for y in range(100, SIZE[1] - 60, 30):
+        cv2.putText(background, WORDS, (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (60, 60, 60), 1)
+    frames = seconds * fps
+    for number in range(frames):
+        frame = background.copy()
+        x = (number * 3) % (SIZE[0] - 120)
+        cv2.rectangle(frame, (x, 300), (x + 120, 340), (200, 80, 80), -1)
+        cv2.putText(frame, str(number), (40, SIZE[1] - 40), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 3)
+        writer.write(frame)
+    writer.release()
+    return frames
+
+
+def click_timestamps(seconds: int, clicks: int, seed: int) -> list[str]:
+    """Clicks come in bursts of a few within a couple of seconds, like a user working through a form."""
+    rng = random.Random(seed)
+    timestamps = []
+    while len(timestamps) < clicks:
+        burst = rng.uniform(0, seconds - 3)
+        timestamps += [burst + rng.uniform(0, 2) for _ in range(rng.randint(1, 5))]
+    timestamps = sorted(timestamps[:clicks])
+    return [TimestampExtractor.format_timestamp_to_hms(offset) for offset in timestamps]
+
+
+def measure(name: str, video: str, timestamps: list[str], directory: str, mode: str,
+            seek_gap: float = FRAME_SEEK_GAP_SECONDS, workers: int = 1, write_threads: int = 0) -> str:
+    output_dir = os.path.join(directory, name)
+    started = time.perf_counter()
+    with VideoFrameExtractor(video, output_dir, seek_gap_seconds=seek_gap, workers=workers,
+                             write_threads=write_threads) as extractor:
+        extracted = extractor.extract_frames(timestamps, mode=mode)
+    elapsed = time.perf_counter() - started
+    print(f"{name:>16} {extracted:>8} {elapsed:>8.2f} {elapsed * 1000 / max(1, extracted):>10.1f}")
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark frame extraction from screen recordings")
+    parser.add_argument("--seconds", type=int, default=120, help="Length of the synthetic recording")
+    parser.add_argument("--fps", type=int, default=30, help="Frame rate of the synthetic recording")
+    parser.add_argument("--clicks", type=int, default=60, help="Timestamps to extract")
+    parser.add_argument("--seek-gap", type=float, nargs="+", default=[FRAME_SEEK_GAP_SECONDS],
+                        help="Seek gaps in seconds to try in sequential mode")
+    parser.add_argument("--workers", type=int, default=FRAME_EXTRACTION_WORKERS,
+                        help="Worker processes in parallel mode")
+    parser.add_argument("--write-threads", type=int, default=FRAME_WRITE_THREADS,
+                        help="PNG writer threads per process in parallel mode")
+    parser.add_argument("--video", help="Use an existing recording instead of a synthetic one")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        video = args.video
+        if not video:
+            video = os.path.join(directory, "recording.mp4")
+            started = time.perf_counter()
+            frames = synthetic_video(video, args.seconds, args.fps)
+            print(f"Rendered {frames} frames in {time.perf_counter() - started:.1f}s")
+        timestamps = click_timestamps(args.seconds, args.clicks, args.seed)
+
+        print(f"{'mode':>16} {'frames':>8} {'s':>8} {'ms/frame':>10}")
+        seek_dir = measure("seek", video, timestamps, directory, "seek")
+        output_dirs = [
+            measure(f"sequential {seek_gap:g}s", video, timestamps, directory, "sequential", seek_gap)
+            for seek_gap in args.seek_gap
+        ]
+        output_dirs.append(measure(f"parallel {args.workers}x{args.write_threads}", video, timestamps, directory,
+                                   "parallel", workers=args.workers, write_threads=args.write_threads))
+
+        names = sorted(os.listdir(seek_dir))
+        for output_dir in output_dirs:
+            _, mismatch, errors = filecmp.cmpfiles(seek_dir, output_dir, names, shallow=False)
+            if mismatch or errors or names != sorted(os.listdir(output_dir)):
+                print(f"{os.path.basename(output_dir)}: outputs differ from seek, "
+                      f"{len(mismatch)} mismatched, {len(errors)} missing")
+        print(f"Compared {len(names)} files per run")
+
+
+if __name__ == "__main__":
+    main()
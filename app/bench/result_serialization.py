@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Result serialization benchmark - peak memory of turning an agent history into
+result JSON plus stored screenshots, the old whole-document way versus the
+step by step walk of `serialize_history`.
+
+Uses stand-in history objects shaped like browser_use's AgentHistoryList with
+incompressible screenshots, so only the serialization path is measured.
+Peak memory is measured with tracemalloc on top of the history itself.
+
+Run from the app directory:
+    python -m bench.result_serialization --steps 50 --screenshot-kib 400
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from agents.history import serialize_history
+from agents.screenshots import ScreenshotStore
+
+
+class StandInState:
+    def __init__(self, index: int, screenshot: str):
+        self.url = f"https://example.com/page/{index}"
+        self.title = f"Page {index}"
+        self.screenshot = screenshot
+
+    def to_dict(self) -> dict:
+        return {"url": self.url, "title": self.title, "tabs": [], "interacted_element": [None],
+                "screenshot": self.screenshot}
+
+
+class StandInStep:
+    def __init__(self, index: int, screenshot: str):
+        self.state = StandInState(index, screenshot)
+        self.index = index
+
+    def model_dump(self) -> dict:
+        return {
+            "model_output": {"current_state": {"memory": "x" * 400, "next_goal": "click the next result"},
+                             "action": [{"click_element_by_index": {"index": self.index}}]},
+            "result": [{"is_done": False, "extracted_content": "y" * 200}],
+            "state": self.state.to_dict(),
+            "metadata": {"step_number": self.index, "input_tokens": 1800},
+        }
+
+
+class StandInHistory:
+    def __init__(self, steps: int, screenshot_bytes: int):
+        self.history = [StandInStep(i, base64.b64encode(os.urandom(screenshot_bytes)).decode()) for i in range(steps)]
+
+    def model_dump_json(self) -> str:
+        return json.dumps({"history": [step.model_dump() for step in self.history]})
+
+
+def serialize_whole(history: StandInHistory, store: ScreenshotStore) -> dict:
+    """What run_task used to do: one JSON round trip, then decode every screenshot."""
+    result_json = json.loads(history.model_dump_json())
+    pending = []
+    for entry in result_json["history"]:
+        data = base64.b64decode(entry["state"]["screenshot"])
+        digest, is_new = store.add(data)
+        entry["state"]["screenshot"] = store.key_for(digest)
+        if is_new:
+            pending.append((digest, data))
+
+    async def save_all():
+        await asyncio.gather(*(store.save(digest, data) for digest, data in pending))
+    asyncio.run(save_all())
+    return result_json
+
+
+def serialize_streaming(history: StandInHistory, store: ScreenshotStore) -> dict:
+    return {"history": asyncio.run(serialize_history(history, "bench", store))}
+
+
+def measure(name: str, serialize, steps: int, screenshot_bytes: int, directory: str):
+    history = StandInHistory(steps, screenshot_bytes)
+    store = ScreenshotStore("", name, local_dir=os.path.join(directory, name), image_format="png", thumbnail_width=0)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = serialize(history, store)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    assert len(result["history"]) == steps
+    print(f"{name:>10} {peak / 2**20:>10.1f} {peak / screenshot_bytes:>12.1f} {elapsed * 1000:>8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark result serialization memory")
+    parser.add_argument("--steps", type=int, default=50, help="Steps in the history")
+    parser.add_argument("--screenshot-kib", type=int, default=400, help="Size of each decoded screenshot")
+    args = parser.parse_args()
+
+    screenshot_bytes = args.screenshot_kib * 1024
+    print(f"{args.steps} steps, {args.screenshot_kib} KiB per screenshot, "
+          f"{args.steps * screenshot_bytes / 2**20:.1f} MiB of images")
+    print(f"{'path':>10} {'peak MiB':>10} {'screenshots':>12} {'ms':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        measure("whole", serialize_whole, args.steps, screenshot_bytes, directory)
+        measure("streaming", serialize_streaming, args.steps, screenshot_bytes, directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Screenshot transcoding benchmark - bytes saved and encode time per image for
+each stored format, using the same encoder as the screenshot pipeline.
+
+Without --images it renders synthetic, text-heavy pages at the agent's
+viewport size, which is what most of our screenshots look like.
+
+Run from the app directory:
+    python -m bench.screenshot_transcode --images ./some_task_dir --quality 80
+"""
+
+import argparse
+import glob
+import io
+import os
+import random
+import statistics
+import time
+
+from PIL import Image, ImageDraw
+
+from agents.screenshots import FORMATS, transcode_screenshot
+
+VIEWPORT = (964, 647)
+WORDS = "agent browser click search result page login submit account price order cart news".split()
+
+
+def synthetic_screenshot(seed: int) -> bytes:
+    rng = random.Random(seed)
+    image = Image.new("RGB", VIEWPORT, "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, VIEWPORT[0], 48), fill=(32, 33, 36))
+    y = 64
+    while y < VIEWPORT[1] - 16:
+        if rng.random() < 0.1:
+            draw.rectangle((16, y, rng.randint(200, 900), y + rng.randint(40, 120)), fill=tuple(rng.randint(0, 255) for _ in range(3)))
+            y += 130
+            continue
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18)))
+        draw.text((16, y), line, fill=(rng.randint(0, 90),) * 3)
+        y += 18
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def load_images(pattern_dir: str | None, count: int) -> list[bytes]:
+    if not pattern_dir:
+        return [synthetic_screenshot(seed) for seed in range(count)]
+    images = []
+    for path in sorted(glob.glob(os.path.join(pattern_dir, "**", "*.png"), recursive=True))[:count]:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark screenshot transcoding")
+    parser.add_argument("--images", help="Directory with PNG screenshots (default: synthetic pages)")
+    parser.add_argument("--count", type=int, default=20, help="Number of images")
+    parser.add_argument("--quality", type=int, default=80, help="Lossy encoder quality")
+    parser.add_argument("--thumbnail-width", type=int, default=0, help="Also build thumbnails of this width")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.count)
+    if not images:
+        raise SystemExit("No images found")
+    original = sum(len(image) for image in images)
+    print(f"{len(images)} images, {original / len(images) / 1024:.1f} KiB average PNG")
+    print(f"{'format':>6} {'avg KiB':>9} {'saved':>7} {'ratio':>6} {'ms/image':>9}")
+
+    for image_format in FORMATS:
+        sizes, timings = [], []
+        for image in images:
+            started = time.perf_counter()
+            encoded, thumbnail = transcode_screenshot(image, image_format, args.quality, args.thumbnail_width)
+            timings.append((time.perf_counter() - started) * 1000)
+            sizes.append(len(encoded) + (len(thumbnail) if thumbnail else 0))
+        total = sum(sizes)
+        print(f"{image_format:>6} {total / len(sizes) / 1024:>9.1f} {1 - total / original:>7.1%} "
+              f"{original / total:>5.1f}x {statistics.median(timings):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
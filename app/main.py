@@ -1,23 +1,44 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import asyncio, os
+from collections import Counter
+from celery import group
 from dotenv import load_dotenv
-import redis
 from screenshot.generate import router as ScreenshotRouter
 from tasks.evaluation import run_browser_task
 from kombu.exceptions import OperationalError
 from utils.status import router as StatusRouter
 from utils.logs import router as LogRouter
-from utils.status import send_status_webhook
-import time
+from utils.progress import router as ProgressRouter
+from utils.webhooks import queue_status_webhook, webhook_dispatcher
+from utils.redis_client import get_redis, close_redis
+from utils.checkpoints import clear_checkpoints
+from utils.pubsub_hub import hub, stream_hub
 
 load_dotenv()
 
-app = FastAPI()
+# How long a client supplied idempotency key keeps rejecting resubmissions
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    hub.start()
+    webhook_dispatcher.start()
+    yield
+    await webhook_dispatcher.stop()
+    await hub.stop()
+    await stream_hub.stop()
+    await close_redis()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(ScreenshotRouter)
 app.include_router(StatusRouter)
 app.include_router(LogRouter)
+app.include_router(ProgressRouter)
 
 
 app.add_middleware(
@@ -43,40 +64,170 @@ async def event_stream():
 async def stream():
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
+def parse_job(data: dict) -> dict:
+    """Validate a job submission and fill in its defaults."""
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="A job must be a JSON object")
+    job_id = data.get("jobId")
+    tasks = data.get("tasks")
+    concurrency = data.get("concurrency")
+    headless = data.get("headless", True)
+
+    if not job_id:
+        raise HTTPException(status_code=400, detail="Missing jobId")
+    if not tasks:
+        raise HTTPException(status_code=400, detail="Missing tasks")
+    if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+        raise HTTPException(status_code=400, detail="concurrency must be a positive integer")
+    if not isinstance(headless, bool):
+        raise HTTPException(status_code=400, detail="headless must be true or false")
+
+    return {
+        "job_id": job_id,
+        "tasks": tasks,
+        "model": data.get("model", "gpt-4o"),
+        "user_id": data.get("userid", "paradigm-shift-job-results"),
+        "concurrency": concurrency,
+        "headless": headless,
+    }
+
+
+def task_signature(job: dict):
+    return run_browser_task.s( # type: ignore untyped
+        job["job_id"], job["tasks"], job["model"], job["user_id"], job["concurrency"], job["headless"]
+    )
+
+
+async def claim_idempotency_keys(keys: list[str | None], job_ids: list[str]) -> list[str | None]:
+    """
+    Register idempotency keys for the given jobs.
+
+    Returns, per job, the jobId of an earlier submission holding the same key,
+    or None when the job is new (or carries no key) and should be started.
+    """
+    redis = get_redis()
+    claimed = [True] * len(keys)
+    async with redis.pipeline(transaction=False) as pipe:
+        for key, job_id in zip(keys, job_ids):
+            if key:
+                pipe.set(f"idempotency:{key}", job_id, nx=True, ex=IDEMPOTENCY_TTL)
+        results = iter(await pipe.execute())
+    for index, key in enumerate(keys):
+        if key:
+            claimed[index] = bool(next(results))
+
+    duplicates: list[str | None] = [None] * len(keys)
+    taken = [index for index, ok in enumerate(claimed) if not ok]
+    if taken:
+        existing = await redis.mget([f"idempotency:{keys[index]}" for index in taken])
+        for index, job_id in zip(taken, existing):
+            duplicates[index] = job_id or job_ids[index]
+    return duplicates
+
+
+async def release_idempotency_keys(keys: list[str | None]):
+    """Forget keys of jobs that could not be started so the client can retry."""
+    keys = [f"idempotency:{key}" for key in keys if key]
+    if keys:
+        await get_redis().delete(*keys)
+
+
+async def mark_queued(job_ids: list[str]):
+    """
+    Write the QUEUED state of all jobs, and queue their webhooks, in a single round-trip.
+
+    A new submission starts over, so checkpoints left by an earlier job with
+    the same jobId are dropped rather than resumed.
+    """
+    async with get_redis().pipeline(transaction=False) as pipe:
+        for job_id in job_ids:
+            clear_checkpoints(pipe, job_id)
+            pipe.set(f"status:{job_id}", "QUEUED")
+            pipe.publish(f"status:{job_id}", "QUEUED")
+            queue_status_webhook(pipe, job_id, "QUEUED")
+        await pipe.execute()
+
+
 @app.post("/webrun")
 async def web(request: Request):
-    redis_client = redis.Redis(host='10.115.18.147')
     try:
         data = await request.json()
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
-    job_id = data.get("jobId")
-    tasks = data.get("tasks")
-    model = data.get("model", "gpt-4o")
-    user_id = data.get("userid", "paradigm-shift-job-results")
+    job = parse_job(data)
+    job_id, user_id = job["job_id"], job["user_id"]
+    idempotency_key = request.headers.get("Idempotency-Key") or data.get("idempotencyKey")
 
-    if not job_id:
-        raise HTTPException(status_code=400, detail="Missing jobId")
-    if not tasks:
-        raise HTTPException(status_code=400, detail="Missing tasks")
+    [duplicate_of] = await claim_idempotency_keys([idempotency_key], [job_id])
+    if duplicate_of:
+        return {"message": f"Duplicate submission, job {duplicate_of} was already started", "jobId": duplicate_of, "duplicate": True}
     print('starting to run')
 
     # Trigger background task with Celery
-    time.sleep(5)
-    redis_client.set(f"status:{job_id}", "QUEUED")
-    redis_client.publish(f"status:{job_id}", "QUEUED")
-    await send_status_webhook(job_id, "QUEUED")
-    redis_client.close()
+    await mark_queued([job_id])
     try:
-        run_browser_task.delay(job_id, tasks, model, user_id) # type: ignore untyped
+        # Publishing to the broker is blocking I/O, keep it off the event loop
+        await asyncio.to_thread(task_signature(job).apply_async)
         print(f'Job Started for {job_id}')
         return {"message": f"Job {job_id} started for user {user_id}"}
     except OperationalError as e:
         print(f"[ERROR] celery connection error: {str(e)}")
+        await release_idempotency_keys([idempotency_key])
         return {'message': f"[ERROR] celery connection error: {str(e)}"}
 
 
+@app.post("/webrun/batch")
+async def web_batch(request: Request):
+    """
+    Submit many jobs at once.
+
+    Each job takes the same fields as /webrun and may carry its own
+    `idempotencyKey`. An `Idempotency-Key` header applies to every job of the
+    batch. Jobs whose key was already used are reported instead of started.
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+
+    raw_jobs = data.get("jobs") if isinstance(data, dict) else None
+    if not isinstance(raw_jobs, list) or not raw_jobs:
+        raise HTTPException(status_code=400, detail="Missing jobs")
+    jobs = [parse_job(raw) for raw in raw_jobs]
+    job_ids = [job["job_id"] for job in jobs]
+    # Compared as strings, like the Redis keys they end up in
+    repeated = sorted(job_id for job_id, count in Counter(map(str, job_ids)).items() if count > 1)
+    if repeated:
+        raise HTTPException(status_code=400, detail=f"Duplicate jobId in batch: {', '.join(repeated)}")
+
+    batch_key = request.headers.get("Idempotency-Key")
+    keys = [
+        raw.get("idempotencyKey") or (f"{batch_key}:{job['job_id']}" if batch_key else None)
+        for raw, job in zip(raw_jobs, jobs)
+    ]
+    duplicate_of = await claim_idempotency_keys(keys, job_ids)
+
+    accepted = [job for job, duplicate in zip(jobs, duplicate_of) if not duplicate]
+    duplicates = [
+        {"jobId": job["job_id"], "duplicateOf": duplicate}
+        for job, duplicate in zip(jobs, duplicate_of) if duplicate
+    ]
+    if not accepted:
+        return {"message": "All jobs were duplicate submissions", "accepted": [], "duplicates": duplicates}
+
+    accepted_ids = [job["job_id"] for job in accepted]
+    await mark_queued(accepted_ids)
+    try:
+        await asyncio.to_thread(group(task_signature(job) for job in accepted).apply_async)
+        print(f'Batch of {len(accepted_ids)} jobs started')
+        return {"message": f"{len(accepted_ids)} jobs started", "accepted": accepted_ids, "duplicates": duplicates}
+    except OperationalError as e:
+        print(f"[ERROR] celery connection error: {str(e)}")
+        await release_idempotency_keys([key for key, duplicate in zip(keys, duplicate_of) if not duplicate])
+        return {'message': f"[ERROR] celery connection error: {str(e)}", "accepted": [], "duplicates": duplicates}
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=os.getenv('HOST', '0.0.0.0'), port=int(os.getenv('PORT', 8000)), ssl_keyfile="/etc/letsencrypt/live/infra.paradigm-shift.ai/privkey.pem", ssl_certfile="/etc/letsencrypt/live/infra.paradigm-shift.ai/fullchain.pem")
\ No newline at end of file
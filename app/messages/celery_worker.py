@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 import os
 
 
@@ -13,6 +14,37 @@ celery_app.conf.update(
     accept_content=["json"],
     task_track_started=True,
     result_expires=3600,
+    # Acknowledge jobs only once they finished, so a crashed worker's job is
+    # redelivered and resumes from its checkpoints instead of being lost;
+    # run_browser_task fails a job after JOB_MAX_ATTEMPTS deliveries
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
+    # Unacknowledged jobs are redelivered after this long, keep it above the longest job
+    broker_transport_options={"visibility_timeout": int(os.getenv("CELERY_VISIBILITY_TIMEOUT", str(6 * 3600)))},
 )
 
-import tasks.evaluation
\ No newline at end of file
+
+@worker_process_init.connect
+def warm_worker_process(**kwargs):
+    from utils.agent_runner import AGENT_EXEC_MODE, preload_agent
+    from utils.browser_pool import browser_pool
+    if AGENT_EXEC_MODE == "fork":
+        # Jobs fork from this zygote, never from the worker and its threads
+        preload_agent()
+    try:
+        browser_pool.warm()
+    except Exception as e:
+        print(f"[WARN] Could not pre-launch browsers: {e}")
+
+
+@worker_process_shutdown.connect
+def close_browser_pool(**kwargs):
+    from utils.browser_pool import browser_pool
+    from utils.xvfb import xvfb_pool
+    browser_pool.close_all()
+    xvfb_pool.close_all()
+
+
+import tasks.evaluation
+import tasks.screenshots
@@ -0,0 +1,216 @@
+"""
+Frame Cache - Zips of earlier frame extractions, keyed by the content of the
+video and event log plus the extraction parameters.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+import requests
+
+from screenshot.events import EVENT_BURST_SECONDS, iter_chunks
+
+FRAME_CACHE_DIR = os.path.expanduser(os.getenv("FRAME_CACHE_DIR", "~/.cache/neuroshift/frames"))
+# 0 disables the cache
+FRAME_CACHE_MAX_MB = int(os.getenv("FRAME_CACHE_MAX_MB", "2048"))
+FRAME_CACHE_TIMEOUT = float(os.getenv("FRAME_CACHE_TIMEOUT", "30"))
+
+# Hit and miss counts of the frame caches of all workers, in Redis
+FRAME_CACHE_STATS_KEY = "screenshot_cache:stats"
+
+# Bump when the frames extracted for the same input change
+EXTRACTION_VERSION = 1
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+class FrameCache:
+    """
+    Size-bounded LRU store of extraction zips on local disk.
+
+    Zips are files named by their key in `directory`; a SQLite index next to
+    them tracks their size and last use, and memoizes the digests of local
+    files by path, size and mtime so an unchanged video is hashed only once.
+    After every new entry the least recently used zips are removed until the
+    cache holds at most `max_mb`.
+    """
+
+    def __init__(self, directory: str = FRAME_CACHE_DIR, max_mb: int = FRAME_CACHE_MAX_MB):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, size INTEGER, created REAL, last_used REAL, meta TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)"
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.zip")
+
+    def digest(self, source: str) -> str:
+        """
+        Content digest of a local file or URL.
+
+        URLs with an ETag or Last-Modified are identified by those validators
+        without downloading them; others are downloaded and hashed.
+        """
+        if source.startswith("http://") or source.startswith("https://"):
+            response = requests.head(source, allow_redirects=True, timeout=FRAME_CACHE_TIMEOUT)
+            response.raise_for_status()
+            validators = [response.headers.get(name) for name in ("ETag", "Last-Modified", "Content-Length")]
+            if validators[0] or validators[1]:
+                material = "\0".join([response.url] + [value or "" for value in validators])
+                return "url:" + hashlib.sha256(material.encode("utf-8")).hexdigest()
+            return self._hash_chunks(iter_chunks(source))
+
+        stat = os.stat(source)
+        path = os.path.abspath(source)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM digests WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+        if row:
+            return row[0]
+        with open(source, "rb") as file:
+            digest = self._hash_chunks(iter(lambda: file.read(_HASH_CHUNK_BYTES), b""))
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                             (path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    @staticmethod
+    def _hash_chunks(chunks) -> str:
+        sha = hashlib.sha256()
+        for chunk in chunks:
+            sha.update(chunk)
+        return sha.hexdigest()
+
+    def key_for(self, video_file: str, jsonl_file: str, events: List[str]) -> str:
+        material = json.dumps({
+            "video": self.digest(video_file),
+            "events_log": self.digest(jsonl_file),
+            "events": sorted(events),
+            "burst_seconds": EVENT_BURST_SECONDS,
+            "version": EXTRACTION_VERSION,
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, zip_path: str) -> Optional[dict]:
+        """
+        Place the cached zip of `key` at `zip_path`.
+
+        Returns:
+            dict: What was stored with the zip, or None on a miss
+        """
+        with self._lock:
+            row = self._db.execute("SELECT meta FROM entries WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        if row and self._place(self._path(key), zip_path, link=True):
+            self.hits += 1
+            return json.loads(row[0] or "{}")
+        if row:
+            # Removed behind our back
+            with self._lock:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.misses += 1
+        return None
+
+    def put(self, key: str, zip_path: str, meta: Optional[dict] = None):
+        """Store a copy of a finished extraction's zip under `key` and evict down to the size limit."""
+        # A copy, never a link: the caller's file may be rewritten in place later
+        if not self._place(zip_path, self._path(key), link=False):
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                             (key, os.path.getsize(self._path(key)), now, now, json.dumps(meta or {})))
+            self._evict()
+
+    @staticmethod
+    def _place(source: str, destination: str, link: bool) -> bool:
+        """
+        Put `source` at `destination` through a private temporary file renamed
+        over it, so the destination never shares a file another path writes to.
+
+        With `link`, a cached zip is hard-linked out instead of copied; whoever
+        later writes to `destination` must unlink it first (the screenshot job
+        does before archiving), which leaves the cache entry untouched.
+        """
+        temporary = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if link:
+                try:
+                    os.link(source, temporary)
+                except OSError:
+                    # e.g. another filesystem
+                    shutil.copyfile(source, temporary)
+            else:
+                shutil.copyfile(source, temporary)
+            os.replace(temporary, destination)
+            return True
+        except FileNotFoundError:
+            return False
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        keys = []
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            keys.append(key)
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": entries,
+            "size_mb": round(size / 2**20, 1),
+            "max_mb": round(self.max_bytes / 2**20),
+        }
+
+
+_cache: Optional[FrameCache] = None
+
+
+def get_frame_cache() -> Optional[FrameCache]:
+    """The frame cache of this process, or None if it is disabled."""
+    global _cache
+    if FRAME_CACHE_MAX_MB <= 0:
+        return None
+    if _cache is None:
+        _cache = FrameCache()
+    return _cache
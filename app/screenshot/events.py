@@ -0,0 +1,212 @@
+"""
+Event Log Reader - Streams recorder event logs (JSON lines, optionally gzipped)
+and picks the events frames are extracted at.
+
+Events follow the recorder's format: every line has a "time_stamp" in seconds;
+mouse buttons are {"button": "left", "pressed": true}, keys are
+{"action": "press", "name": "enter"}, scrolls are {"action": "scroll", "dx", "dy"}
+and page loads are {"action": "navigate", "url": ...}.
+"""
+
+import itertools
+import logging
+import os
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import orjson
+import requests
+
+# Read size of remote logs
+EVENT_LOG_CHUNK_BYTES = int(os.getenv("EVENT_LOG_CHUNK_BYTES", str(64 * 1024)))
+EVENT_LOG_TIMEOUT = float(os.getenv("EVENT_LOG_TIMEOUT", "60"))
+# Events of one kind closer together than this form a burst, of which only the first is kept
+EVENT_BURST_SECONDS = float(os.getenv("EVENT_BURST_SECONDS", "0.5"))
+
+NAVIGATION_ACTIONS = {"navigate", "navigation", "url_change", "page_load"}
+
+
+def iter_chunks(source: str) -> Iterator[bytes]:
+    """Read a local or remote event log in chunks as they arrive; HTTP Content-Encoding is undone."""
+    if source.startswith("http://") or source.startswith("https://"):
+        with requests.get(source, stream=True, timeout=EVENT_LOG_TIMEOUT) as response:
+            response.raise_for_status()
+            yield from response.iter_content(EVENT_LOG_CHUNK_BYTES)
+    else:
+        with open(source, "rb") as file:
+            yield from iter(lambda: file.read(EVENT_LOG_CHUNK_BYTES), b"")
+
+
+def gunzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Decompress a gzipped stream (.jsonl.gz) on the fly; anything else passes through."""
+    chunks = iter(chunks)
+    first = next(chunks, b"")
+    if first[:2] != b"\x1f\x8b":
+        yield first
+        yield from chunks
+        return
+    decompressor = zlib.decompressobj(wbits=31)
+    for chunk in itertools.chain([first], chunks):
+        while chunk:
+            yield decompressor.decompress(chunk)
+            # Concatenated gzip members
+            chunk = decompressor.unused_data
+            if chunk:
+                decompressor = zlib.decompressobj(wbits=31)
+    yield decompressor.flush()
+
+
+def split_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def iter_events(lines: Iterable[bytes]) -> Iterator[Tuple[int, dict]]:
+    """Yield (line number, event) for every parseable line, one line in memory at a time."""
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            logging.warning(f"Invalid JSON in line {line_num}")
+            continue
+        if isinstance(event, dict):
+            yield line_num, event
+
+
+class EventFilter:
+    """
+    Selects events to extract frames at.
+
+    `matches` sees every event of a log in order with its offset in seconds
+    from the first event. Filters may keep state across calls, so use a
+    fresh instance per log (see `build_filters`).
+    """
+
+    def matches(self, event: dict, offset: float) -> bool:
+        raise NotImplementedError
+
+
+class ClickFilter(EventFilter):
+    """Mouse button presses, the left button by default."""
+
+    def __init__(self, button: Optional[str] = "left"):
+        self.button = button
+
+    def matches(self, event: dict, offset: float) -> bool:
+        return bool(event.get("pressed", False)) and (self.button is None or event.get("button") == self.button)
+
+
+class KeypressFilter(EventFilter):
+    """Key presses, optionally only of the given key names (e.g. {"enter", "tab"})."""
+
+    def __init__(self, keys: Optional[Iterable[str]] = None):
+        self.keys = {self._normalize(key) for key in keys} if keys else None
+
+    @staticmethod
+    def _normalize(name) -> str:
+        name = str(name).lower()
+        return name[4:] if name.startswith("key.") else name
+
+    def matches(self, event: dict, offset: float) -> bool:
+        if event.get("action") != "press":
+            return False
+        return self.keys is None or self._normalize(event.get("name", event.get("key", ""))) in self.keys
+
+
+class ScrollFilter(EventFilter):
+    """Scroll events moving at least `min_delta` steps."""
+
+    def __init__(self, min_delta: float = 0):
+        self.min_delta = min_delta
+
+    def matches(self, event: dict, offset: float) -> bool:
+        if event.get("action") != "scroll":
+            return False
+        return abs(event.get("dx") or 0) + abs(event.get("dy") or 0) > self.min_delta
+
+
+class NavigationFilter(EventFilter):
+    """Page navigations."""
+
+    def matches(self, event: dict, offset: float) -> bool:
+        return event.get("action") in NAVIGATION_ACTIONS
+
+
+class Debounce(EventFilter):
+    """
+    Keep only the first event of each burst of another filter's events; a burst
+    goes on while matching events are less than `window` seconds apart.
+    """
+
+    def __init__(self, inner: EventFilter, window: float = EVENT_BURST_SECONDS):
+        self.inner = inner
+        self.window = window
+        self._last: Optional[float] = None
+
+    def matches(self, event: dict, offset: float) -> bool:
+        if not self.inner.matches(event, offset):
+            return False
+        in_burst = self._last is not None and offset - self._last < self.window
+        self._last = offset
+        return not in_burst
+
+
+# Filters selectable by name; each call builds fresh instances
+EVENT_FILTERS = {
+    "clicks": lambda: ClickFilter(),
+    "click_bursts": lambda: Debounce(ClickFilter()),
+    "keypresses": lambda: Debounce(KeypressFilter()),
+    "enter": lambda: KeypressFilter({"enter"}),
+    "scrolls": lambda: Debounce(ScrollFilter()),
+    "navigation": lambda: NavigationFilter(),
+}
+
+
+def build_filters(names: Iterable[str]) -> List[EventFilter]:
+    unknown = [name for name in names if name not in EVENT_FILTERS]
+    if unknown:
+        raise ValueError(f"Unknown event filters {unknown}, expected some of {sorted(EVENT_FILTERS)}")
+    return [EVENT_FILTERS[name]() for name in names]
+
+
+def extract_event_offsets(source: str, filters: Optional[List[EventFilter]] = None) -> List[float]:
+    """
+    Stream an event log and return the offsets in seconds, relative to the
+    first event, of every event any filter selects. Left clicks by default.
+    """
+    filters = filters if filters is not None else build_filters(["clicks"])
+    offsets = []
+    events = iter_events(split_lines(gunzip_chunks(iter_chunks(source))))
+    try:
+        first = next(events, None)
+        if first is None:
+            logging.error("Empty JSONL file")
+            return []
+        first_timestamp = first[1].get("time_stamp")
+        if first_timestamp is None:
+            logging.error("First line missing time_stamp field")
+            return []
+
+        for line_num, event in events:
+            current_timestamp = event.get("time_stamp")
+            if current_timestamp is None:
+                logging.debug(f"Missing time_stamp in line {line_num}")
+                continue
+            offset = max(0.0, current_timestamp - first_timestamp)
+            # Every filter sees every event, so stateful filters stay consistent
+            matched = [event_filter.matches(event, offset) for event_filter in filters]
+            if any(matched):
+                offsets.append(offset)
+    finally:
+        # Release the file or connection even when stopping early
+        events.close()
+    logging.info(f"Found {len(offsets)} events")
+    return offsets
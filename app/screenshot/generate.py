@@ -4,19 +4,45 @@ Video Frame Extractor - Extracts frames from videos at timestamps recorded in a
 """
 
 import argparse
-import shutil
+import asyncio
+import bisect
+import itertools
+import multiprocessing
+import threading
 import cv2
 import json
 import logging
 import os
-from typing import List, Optional
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import List, Optional, Tuple, Union
 
 from fastapi import HTTPException, Request, APIRouter
 from fastapi.responses import FileResponse
+from kombu.exceptions import OperationalError
 import requests
 
+from screenshot.cache import FRAME_CACHE_STATS_KEY
+from screenshot.events import EventFilter, build_filters, extract_event_offsets
+from utils.redis_client import get_redis
+
 router = APIRouter()
 
+# "parallel" decodes segments of the video in worker processes, "sequential" decodes
+# it once in timestamp order, "seek" seeks to every timestamp
+FRAME_EXTRACTION_MODE = os.getenv("FRAME_EXTRACTION_MODE", "parallel")
+# Gaps longer than this are skipped with a seek instead of decoding through them;
+# a seek costs about as much as decoding a second of a screen recording
+FRAME_SEEK_GAP_SECONDS = float(os.getenv("FRAME_SEEK_GAP_SECONDS", "1"))
+# Processes decoding segments in parallel mode
+FRAME_EXTRACTION_WORKERS = int(os.getenv("FRAME_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+# Seconds of video a worker process must have to be worth starting
+FRAME_SEGMENT_MIN_SECONDS = float(os.getenv("FRAME_SEGMENT_MIN_SECONDS", "30"))
+# Threads encoding and writing PNGs (per process) in parallel mode
+FRAME_WRITE_THREADS = int(os.getenv("FRAME_WRITE_THREADS", "4"))
+
 
 class TimestampExtractor:
     """Handles extraction of relevant timestamps from event logs."""
@@ -45,91 +71,107 @@ class TimestampExtractor:
             logging.error(f"Error parsing timestamp {timestamp}: {e}")
             return None
 
-    def extract_click_timestamps(self, jsonl_file: str) -> List[str]:
+    def extract_event_offsets(self, jsonl_file: str, filters: Optional[List[EventFilter]] = None) -> List[float]:
         """
-        Extract left-click timestamps from a remote JSONL file relative to the first event.
+        Stream a local or remote JSONL event log and return the offsets in
+        seconds, relative to the first event, of the events the filters select.
         
         Args:
-            jsonl_file: URL to the JSONL log file
+            jsonl_file: URL or path of the JSONL log file, optionally gzipped
+            filters: Event filters (see screenshot.events), left clicks by default
             
         Returns:
-            List of timestamps in HH:MM:SS.mmm format
+            List of offsets in seconds
         """
-        timestamps = []
-
         try:
-            # Check if the input is a URL
-            if jsonl_file.startswith("http://") or jsonl_file.startswith("https://"):
-                response = requests.get(jsonl_file)
-                response.raise_for_status()
-                lines = response.text.splitlines()
-            else:
-                # Read local file if not a URL
-                with open(jsonl_file, "r") as file:
-                    lines = file.readlines()
-
-            # Get base timestamp from first line
-            first_line = lines[0].strip() if lines else None
-            if not first_line:
-                logging.error("Empty JSONL file")
-                return []
-                
-            first_event = json.loads(first_line)
-            first_timestamp = first_event.get("time_stamp")
-            if first_timestamp is None:
-                logging.error("First line missing time_stamp field")
-                return []
-
-            # Process each subsequent line
-            for line_num, line in enumerate(lines[1:], 2):  # Start counting from line 2
-                line = line.strip()
-                if not line:
-                    continue
-                    
-                try:
-                    event = json.loads(line)
-
-                    # Check for left-click events when the button is pressed
-                    if event.get("pressed", False) and event.get("button") == "left":
-                        current_timestamp = event.get("time_stamp")
-                        if current_timestamp is None:
-                            logging.warning(f"Missing time_stamp in line {line_num}")
-                            continue
-
-                        relative_timestamp = max(0.0, current_timestamp - first_timestamp)
-                        formatted_time = self.format_timestamp_to_hms(relative_timestamp)
-                        timestamps.append(formatted_time)
-                except json.JSONDecodeError:
-                    logging.warning(f"Invalid JSON in line {line_num}")
-
+            return extract_event_offsets(jsonl_file, filters)
         except requests.RequestException as e:
             logging.error(f"Error fetching JSONL from URL: {e}")
         except FileNotFoundError:
             logging.error(f"File not found: {jsonl_file}")
-        except json.JSONDecodeError:
-            logging.error(f"Invalid JSON in the first line of {jsonl_file}")
         except Exception as e:
             logging.error(f"Error processing JSONL file: {e}")
+        return []
+
+    def extract_click_timestamps(self, jsonl_file: str) -> List[str]:
+        """
+        Extract left-click timestamps from a JSONL file relative to the first event.
+        
+        Args:
+            jsonl_file: URL or path of the JSONL log file
+            
+        Returns:
+            List of timestamps in HH:MM:SS.mmm format
+        """
+        return [self.format_timestamp_to_hms(offset) for offset in self.extract_event_offsets(jsonl_file)]
+
+
+class FrameWriter:
+    """Encodes and writes frames on a thread pool; cv2.imwrite releases the GIL while encoding."""
+
+    def __init__(self, threads: int):
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="frame-writer")
+        # Bound the decoded frames waiting to be written
+        self._slots = threading.BoundedSemaphore(threads * 2)
+        self._futures = []
+
+    def submit(self, output_path: str, frame):
+        self._slots.acquire()
+        future = self._pool.submit(cv2.imwrite, output_path, frame)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append((output_path, future))
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        for output_path, future in self._futures:
+            if future.exception() or not future.result():
+                logging.warning(f"Failed to write frame {output_path}: {future.exception()}")
+        self._futures = []
+
 
-        logging.info(f"Found {len(timestamps)} click events")
-        return timestamps
+def _frame_number(milliseconds: float, fps: float) -> int:
+    """Frame OpenCV's CAP_PROP_POS_MSEC seek lands on."""
+    return int(milliseconds * fps / 1000 + 0.5)
+
+
+def _extract_segment(video_file: str, output_dir: str, seek_gap_seconds: float, write_threads: int,
+                     start_frame: int, targets: List[Tuple[int, str, float]]) -> int:
+    """Worker process of the parallel mode: walk one segment, starting at a keyframe."""
+    with VideoFrameExtractor(video_file, output_dir, seek_gap_seconds=seek_gap_seconds,
+                             write_threads=write_threads) as extractor:
+        if not extractor._cap:
+            return 0
+        fps = extractor._cap.get(cv2.CAP_PROP_FPS)
+        if start_frame > 0:
+            extractor._cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        with extractor._threaded_writes():
+            return extractor._extract_sequential(targets, fps, next_frame=start_frame)
 
 
 class VideoFrameExtractor:
     """Handles extraction of frames from video files at specified timestamps."""
     
-    def __init__(self, video_file: str, output_dir: str):
+    def __init__(self, video_file: str, output_dir: str, seek_gap_seconds: float = FRAME_SEEK_GAP_SECONDS,
+                 workers: int = FRAME_EXTRACTION_WORKERS, write_threads: int = FRAME_WRITE_THREADS):
         """
         Initialize the frame extractor.
         
         Args:
             video_file: Path to the video file
             output_dir: Directory to save extracted frames
+            seek_gap_seconds: In sequential mode, seek over gaps longer than this
+                instead of decoding through them
+            workers: Processes decoding segments in parallel mode
+            write_threads: Threads writing frames per process in parallel mode
         """
         self.video_file = video_file
         self.output_dir = output_dir
+        self.seek_gap_seconds = seek_gap_seconds
+        self.workers = max(1, workers)
+        self.write_threads = write_threads
         os.makedirs(output_dir, exist_ok=True)
         self._cap = None
+        self._writer: Optional[FrameWriter] = None
         
     def __enter__(self):
         """Context manager entry - opens the video file."""
@@ -146,12 +188,15 @@ class VideoFrameExtractor:
             self._cap.release()
             self._cap = None
         
-    def extract_frames(self, timestamps: List[str]) -> int:
+    def extract_frames(self, timestamps: List[Union[str, float]], mode: str = FRAME_EXTRACTION_MODE) -> int:
         """
         Extract frames from the video at the given timestamps.
         
         Args:
-            timestamps: List of timestamps in HH:MM:SS.mmm format
+            timestamps: List of offsets in seconds or timestamps in HH:MM:SS.mmm format
+            mode: "parallel" to decode segments of the video in worker processes,
+                "sequential" to decode it once in timestamp order, or "seek" to
+                seek to every timestamp
             
         Returns:
             Number of successfully extracted frames
@@ -170,36 +215,26 @@ class VideoFrameExtractor:
             logging.error(f"Cannot open video file: {self.video_file}")
             return 0
 
-        extracted_count = 0
         timestamp_extractor = TimestampExtractor()
-        
-        try:
-            for idx, timestamp in enumerate(timestamps):
+        targets = []
+        for idx, timestamp in enumerate(timestamps):
+            if isinstance(timestamp, str):
                 milliseconds = timestamp_extractor.parse_hms_to_milliseconds(timestamp)
-                if milliseconds is None:
-                    continue
-                    
-                # Set video position and read frame
-                self._cap.set(cv2.CAP_PROP_POS_MSEC, milliseconds)
-                success, frame = self._cap.read()
-                
-                if success:
-                    # Create a safe filename with timestamp
-                    safe_timestamp = timestamp.replace(':', '_')
-                    output_path = os.path.join(
-                        self.output_dir, 
-                        f"frame_{idx+1}_{safe_timestamp}.png"
-                    )
-                    
-                    # Save the frame and immediately release memory
-                    cv2.imwrite(output_path, frame)
-                    # Explicitly clear the frame from memory
-                    del frame
-                    
-                    extracted_count += 1
-                    logging.debug(f"Extracted frame at {timestamp} to {output_path}")
-                else:
-                    logging.warning(f"Failed to retrieve frame at {timestamp}")
+            else:
+                # Offsets only go through HH:MM:SS for the filename
+                milliseconds = timestamp * 1000
+                timestamp = timestamp_extractor.format_timestamp_to_hms(timestamp)
+            if milliseconds is not None:
+                targets.append((idx, timestamp, milliseconds))
+
+        try:
+            fps = self._cap.get(cv2.CAP_PROP_FPS)
+            if mode == "parallel" and fps > 0:
+                extracted_count = self._extract_parallel(targets, fps)
+            elif mode == "sequential" and fps > 0:
+                extracted_count = self._extract_sequential(targets, fps)
+            else:
+                extracted_count = self._extract_seeking(targets)
         finally:
             # Only release if we created the capture in this method
             if needs_cleanup and self._cap:
@@ -209,8 +244,165 @@ class VideoFrameExtractor:
         logging.info(f"Extracted {extracted_count} of {len(timestamps)} frames")
         return extracted_count
 
+    def _write_frame(self, idx: int, timestamp: str, frame) -> str:
+        # Create a safe filename with timestamp
+        safe_timestamp = timestamp.replace(':', '_')
+        output_path = os.path.join(
+            self.output_dir,
+            f"frame_{idx+1}_{safe_timestamp}.png"
+        )
+        if self._writer:
+            self._writer.submit(output_path, frame)
+        else:
+            cv2.imwrite(output_path, frame)
+        logging.debug(f"Extracted frame at {timestamp} to {output_path}")
+        return output_path
+
+    @contextmanager
+    def _threaded_writes(self):
+        """Write frames on a thread pool while decoding goes on, waiting for all of them at exit."""
+        if self.write_threads <= 0:
+            yield
+            return
+        self._writer = FrameWriter(self.write_threads)
+        try:
+            yield
+        finally:
+            self._writer.close()
+            self._writer = None
+
+    def _extract_seeking(self, targets: List[Tuple[int, str, float]]) -> int:
+        """Seek to every timestamp; each seek decodes again from the previous keyframe."""
+        extracted_count = 0
+        for idx, timestamp, milliseconds in targets:
+            # Set video position and read frame
+            self._cap.set(cv2.CAP_PROP_POS_MSEC, milliseconds)
+            success, frame = self._cap.read()
+
+            if success:
+                self._write_frame(idx, timestamp, frame)
+                # Explicitly clear the frame from memory
+                del frame
+                extracted_count += 1
+            else:
+                logging.warning(f"Failed to retrieve frame at {timestamp}")
+        return extracted_count
+
+    def _extract_sequential(self, targets: List[Tuple[int, str, float]], fps: float, next_frame: int = 0) -> int:
+        """
+        Walk the video once in timestamp order.
+
+        Frames between targets are only grabbed (demuxed and decoded, never
+        converted), and only target frames are retrieved. A gap longer than
+        `self.seek_gap_seconds` is skipped with a single seek. Timestamps map to
+        the same frame as OpenCV's own millisecond seek.
+
+        `next_frame` is the index of the frame the next grab() returns.
+        """
+        extracted_count = 0
+        seek_gap_frames = max(1, int(self.seek_gap_seconds * fps))
+        by_frame = sorted(targets, key=lambda target: (target[2], target[0]))
+
+        for frame_number, group in itertools.groupby(by_frame, key=lambda target: _frame_number(target[2], fps)):
+            group = list(group)
+            if frame_number - next_frame > seek_gap_frames:
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+                next_frame = frame_number
+
+            success = True
+            while success and next_frame <= frame_number:
+                success = self._cap.grab()
+                next_frame += 1
+            frame = None
+            if success:
+                success, frame = self._cap.retrieve()
+
+            if not success:
+                for _, timestamp, _ in group:
+                    logging.warning(f"Failed to retrieve frame at {timestamp}")
+                continue
+            # Several clicks within one frame share it
+            for idx, timestamp, _ in group:
+                self._write_frame(idx, timestamp, frame)
+                extracted_count += 1
+            del frame
+        return extracted_count
+
+    def _keyframes(self) -> List[int]:
+        """Frame numbers of the video's keyframes, read from packet flags without decoding."""
+        cap = cv2.VideoCapture(self.video_file)
+        keyframes = []
+        try:
+            # Raw mode: grab() only demuxes the next packet
+            if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+                return keyframes
+            packet = 0
+            while cap.grab():
+                if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    keyframes.append(packet)
+                packet += 1
+        finally:
+            cap.release()
+        return keyframes
 
-def process_video(video_file: str, jsonl_file: str, output_dir: str) -> None:
+    def _segments(self, targets: List[Tuple[int, str, float]], fps: float) -> List[Tuple[int, list]]:
+        """
+        Split the targets into (start frame, targets) segments of about equal
+        length, cut at keyframes so no worker decodes another one's frames.
+        """
+        frames = sorted(_frame_number(target[2], fps) for target in targets)
+        span = frames[-1] - frames[0]
+        count = min(self.workers, int(span / fps / FRAME_SEGMENT_MIN_SECONDS) + 1)
+        if count <= 1:
+            return [(0, targets)]
+
+        keyframes = self._keyframes()
+        cuts = []
+        for i in range(1, count):
+            cut = frames[0] + span * i // count
+            # Snap to the keyframe at or before the cut; any frame works without keyframe info
+            position = bisect.bisect_right(keyframes, cut)
+            if position:
+                cut = keyframes[position - 1]
+            if cut > frames[0] and (not cuts or cut > cuts[-1]):
+                cuts.append(cut)
+
+        segments = [[] for _ in range(len(cuts) + 1)]
+        for target in targets:
+            segments[bisect.bisect_right(cuts, _frame_number(target[2], fps))].append(target)
+        starts = [0] + cuts
+        return [(start, segment) for start, segment in zip(starts, segments) if segment]
+
+    def _extract_parallel(self, targets: List[Tuple[int, str, float]], fps: float) -> int:
+        """
+        Decode keyframe-aligned segments in worker processes, each walking its
+        segment like the sequential mode and writing frames on a thread pool.
+        Filenames do not depend on which worker wrote a frame.
+        """
+        if not targets:
+            return 0
+        segments = self._segments(targets, fps)
+        if len(segments) > 1:
+            try:
+                # spawn: forking a process that runs OpenCV's (or the server's) threads can deadlock
+                with ProcessPoolExecutor(max_workers=len(segments),
+                                         mp_context=multiprocessing.get_context("spawn")) as pool:
+                    futures = [
+                        pool.submit(_extract_segment, self.video_file, self.output_dir, self.seek_gap_seconds,
+                                    self.write_threads, start, segment)
+                        for start, segment in segments
+                    ]
+                    return sum(future.result() for future in futures)
+            except (AssertionError, OSError, BrokenProcessPool) as e:
+                # e.g. inside a daemonic worker process, which may not have children
+                logging.warning(f"Parallel extraction unavailable, extracting in-process: {e}")
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+        with self._threaded_writes():
+            return self._extract_sequential(targets, fps)
+
+
+def process_video(video_file: str, jsonl_file: str, output_dir: str, events: Optional[List[str]] = None) -> None:
     """
     Main processing function to extract frames from video based on JSONL events.
     
@@ -218,10 +410,11 @@ def process_video(video_file: str, jsonl_file: str, output_dir: str) -> None:
         video_file: Path to the video file
         jsonl_file: Path to the JSONL event log file
         output_dir: Directory to save extracted frames
+        events: Names of the event filters to extract frames at, left clicks by default
     """
-    # Extract timestamps from the JSONL file
+    # Extract event offsets from the JSONL file
     timestamp_extractor = TimestampExtractor()
-    timestamps = timestamp_extractor.extract_click_timestamps(jsonl_file)
+    timestamps = timestamp_extractor.extract_event_offsets(jsonl_file, build_filters(events or ["clicks"]))
     
     if not timestamps:
         logging.warning("No valid timestamps found in the JSONL file")
@@ -249,6 +442,9 @@ def parse_arguments():
                         help="Path to JSONL event log file")
     parser.add_argument("--output", "-o", default="output_frames",
                         help="Output directory for extracted frames")
+    parser.add_argument("--events", "-e", default="clicks",
+                        help="Comma-separated event filters to extract frames at: clicks, click_bursts, "
+                             "keypresses, enter, scrolls, navigation")
     parser.add_argument("--verbose", action="store_true",
                         help="Enable verbose logging")
     parser.add_argument("--memory-limit", type=int, default=0,
@@ -279,7 +475,7 @@ def main():
     logging.info(f"Saving frames to: {args.output}")
     
     try:
-        process_video(args.video, args.jsonl, args.output)
+        process_video(args.video, args.jsonl, args.output, args.events.split(","))
         logging.info("Processing complete")
     except Exception as e:
         logging.error(f"Unhandled exception: {e}")
@@ -296,12 +492,18 @@ def main():
 @router.post("/generate/screenshots")
 async def generateScreenshots(request: Request):
     """
-    Main processing function to extract frames from video based on JSONL events.
+    Queue a job extracting frames from video based on JSONL events.
+
+    Extraction runs on the Celery worker; this returns the job id at once.
+    Follow it on /status/{jobId} and /progress/{jobId}, then download the
+    zip from /generate/screenshots/{jobId}/download.
     
     Args:
         video_file: Path to the video file
         jsonl_file: Path to the JSONL event log file
         output_dir: Directory to save extracted frames
+        events: Optional names of the event filters to extract frames at
+        jobId: Optional id for the job, generated if missing
     """
     data = await request.json()
     video_file = data.get("video_file")
@@ -309,22 +511,72 @@ async def generateScreenshots(request: Request):
     output_dir = data.get("output_dir")
     if not video_file or not jsonl_file or not output_dir:
         raise HTTPException(status_code=400, detail="Missing required parameters")
-    # Extract timestamps from the JSONL file
-    timestamp_extractor = TimestampExtractor()
-    timestamps = timestamp_extractor.extract_click_timestamps(jsonl_file)
-    
+    events = data.get("events") or ["clicks"]
+    try:
+        build_filters(events)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job_id = data.get("jobId") or f"screenshots-{uuid.uuid4().hex}"
 
-    if not timestamps:
-        print("No valid timestamps found in the JSONL file")
-        return
-        
-    # Extract frames at the identified timestamps using context manager
-    # to ensure proper resource cleanup
-    with VideoFrameExtractor(video_file, output_dir) as frame_extractor:
-        frame_extractor.extract_frames(timestamps)
-    
-    zip_path = f"{output_dir}.zip"
-    shutil.make_archive(output_dir, 'zip', output_dir)
+    # Imported here: the task module imports this one
+    from tasks.screenshots import generate_screenshots
+
+    async with get_redis().pipeline(transaction=False) as pipe:
+        pipe.set(f"status:{job_id}", "QUEUED")
+        pipe.publish(f"status:{job_id}", "QUEUED")
+        await pipe.execute()
+    try:
+        # Publishing to the broker is blocking I/O, keep it off the event loop
+        await asyncio.to_thread(
+            generate_screenshots.apply_async, # type: ignore untyped
+            (job_id, video_file, jsonl_file, output_dir, events)
+        )
+    except OperationalError as e:
+        print(f"[ERROR] celery connection error: {str(e)}")
+        await get_redis().set(f"status:{job_id}", "FAILED")
+        raise HTTPException(status_code=503, detail=f"celery connection error: {str(e)}")
+
+    return {
+        "jobId": job_id,
+        "status": "QUEUED",
+        "status_url": f"/status/{job_id}",
+        "progress_url": f"/progress/{job_id}",
+        "download_url": f"/generate/screenshots/{job_id}/download",
+    }
+
+
+async def screenshot_job(job_id: str) -> dict:
+    redis = get_redis()
+    status, result = await redis.mget(f"status:{job_id}", f"screenshots:{job_id}")
+    if status is None and result is None:
+        raise HTTPException(status_code=404, detail=f"Unknown screenshot job {job_id}")
+    return {"jobId": job_id, **(json.loads(result) if result else {}), "status": status}
+
+
+@router.get("/generate/screenshots/cache/stats")
+async def screenshotCacheStats():
+    """Hits and misses of the frame caches of all workers."""
+    stats = {field: int(value) for field, value in (await get_redis().hgetall(FRAME_CACHE_STATS_KEY)).items()}
+    total = stats.get("hits", 0) + stats.get("misses", 0)
+    return {"hits": stats.get("hits", 0), "misses": stats.get("misses", 0),
+            "hit_rate": round(stats.get("hits", 0) / total, 3) if total else 0.0}
+
+
+@router.get("/generate/screenshots/{job_id}")
+async def screenshotJobStatus(job_id: str):
+    """Status of a screenshot job, with frame counts once it finished."""
+    return await screenshot_job(job_id)
+
+
+@router.get("/generate/screenshots/{job_id}/download")
+async def downloadScreenshots(job_id: str):
+    """The zip of a completed screenshot job."""
+    job = await screenshot_job(job_id)
+    if job["status"] != "COMPLETED":
+        raise HTTPException(status_code=409, detail=f"Screenshot job {job_id} is {job['status']}")
+    zip_path = job.get("zip_path")
+    if not zip_path or not os.path.exists(zip_path):
+        raise HTTPException(status_code=404, detail=f"Archive of screenshot job {job_id} is gone")
     
     # Return the zip file as a response
     return FileResponse(zip_path, media_type='application/zip', filename=f"{os.path.basename(zip_path)}")
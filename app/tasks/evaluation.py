@@ -1,129 +1,159 @@
-import subprocess
 import redis
 from redis.exceptions import ConnectionError
 from messages.celery_worker import celery_app
-from utils.clean_log import clean_log
 import time
 import os
-import random
-import asyncio
-from utils.status import send_status_webhook
+from utils.webhooks import queue_status_webhook
+from utils.browser_pool import browser_pool, BROWSER_POOL_SIZE
+from utils.xvfb import xvfb_pool
+from utils.agent_runner import start_agent_process
+from utils.log_capture import LogCapture, LOG_STREAM_MAXLEN
+from utils.checkpoints import JOB_MAX_ATTEMPTS, checkpoint_key, clear_checkpoints, start_attempt
+from utils.progress_relay import ProgressRelay
+import socket
 
 # Redis connection
 redis_client = redis.Redis(host='10.115.18.147')
 
-@celery_app.task(bind=True, name="tasks.evaluation.run_browser_task")
-def run_browser_task(self, job_id, tasks, model="gpt-4o", user_id="paradigm-shift-job-results"):
 
-    def log_message(channel, message):
-        redis_client.publish(channel, message)
-        redis_client.rpush(channel, message)
+def set_job_status(job_id: str, status: str, publish: bool = True):
+    """Store and publish a job status and queue its webhook, in one round-trip."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.set(f"status:{job_id}", status)
+    if publish:
+        pipe.publish(f"status:{job_id}", status)
+    queue_status_webhook(pipe, job_id, status)
+    pipe.execute()
+
+
+@celery_app.task(bind=True, name="tasks.evaluation.run_browser_task")
+def run_browser_task(self, job_id, tasks, model="gpt-4o", user_id="paradigm-shift-job-results", concurrency=None, headless=True):
 
-    def get_free_display():
-        for _ in range(50):  # Try 50 random times
-            display = random.randint(1000, 9999)
-            if not os.path.exists(f"/tmp/.X{display}-lock"):
-                return display
-        raise RuntimeError("Could not find free X display")
+    def log_message(stream, message):
+        redis_client.xadd(stream, {"line": message}, maxlen=LOG_STREAM_MAXLEN, approximate=True)
 
-    log_channel = f"log:{job_id}"
-    status_channel = f"status:{job_id}"
+    log_stream = f"logstream:{job_id}"
 
     try:
         if redis_client.ping():
-            log_message(log_channel, "[INFO] Successfully connected to Redis")
+            log_message(log_stream, "[INFO] Successfully connected to Redis")
         else:
-            log_message(log_channel, "[ERROR] Redis ping failed")
+            log_message(log_stream, "[ERROR] Redis ping failed")
             return {"status": "redis-ping-failed"}
     except ConnectionError as e:
-        log_message(log_channel, f"[ERROR] Redis connection error: {str(e)}")
+        log_message(log_stream, f"[ERROR] Redis connection error: {str(e)}")
         return {"status": "redis-connection-error"}
 
-    time.sleep(3)  # Optional startup delay
-    redis_client.set(f"status:{job_id}", "STARTED")
-    log_message(log_channel, "[INFO] Task started")
-    asyncio.run(send_status_webhook(job_id, "STARTED"))
-
-    # === Xvfb Setup ===
-    display_num = get_free_display()
-    display_str = f":{display_num}"
-    log_message(log_channel, f"[INFO] Launching Xvfb on display {display_str}")
+    # Counted per submission; the API resets it when the job is queued
+    attempt = start_attempt(redis_client, job_id)
+    if attempt > JOB_MAX_ATTEMPTS:
+        # The job keeps taking its worker down, stop redelivering it
+        set_job_status(job_id, "FAILED")
+        log_message(log_stream, f"[ERROR] Giving up after {JOB_MAX_ATTEMPTS} attempts")
+        clear_checkpoints(redis_client, job_id)
+        return {"status": "failed", "error": f"gave up after {JOB_MAX_ATTEMPTS} attempts"}
+    # Only an attempt after a lost worker or a retry resumes, never a new submission
+    delivery_info = self.request.delivery_info or {}
+    resume = attempt > 1 or self.request.retries > 0 or bool(delivery_info.get("redelivered"))
 
-    xvfb_proc = None
+    time.sleep(3)  # Optional startup delay
+    set_job_status(job_id, "STARTED", publish=False)
+    log_message(log_stream, "[INFO] Task started")
+
+    xvfb_display = None
+    pooled_browser = None
+    progress = None
+    # From here on agent output and our own lines go through one batched writer
+    capture = LogCapture(redis_client, log_stream)
     try:
-        xvfb_proc = subprocess.Popen(
-            ["Xvfb", display_str, "-screen", "0", "1024x768x24"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-
-        time.sleep(1)  # Wait a moment for Xvfb to initialize
-
-        # Set DISPLAY for subprocess
         env = os.environ.copy()
-        env["DISPLAY"] = display_str
+
+        # === Xvfb Setup ===
+        # Headless Chromium needs no display; only headed runs borrow an Xvfb server
+        if not headless:
+            xvfb_display = xvfb_pool.acquire()
+            env["DISPLAY"] = xvfb_display.display
+            capture.log(f"[INFO] Using Xvfb on display {xvfb_display.display}")
 
         # === Actual Task ===
         cmd = [
-            "python", "agents/browseruse.py",
             "--jobId", job_id,
             "--tasks", tasks,
             "--user", user_id,
             "--model", model
         ]
-
-        redis_client.set(f"status:{job_id}", "IN_PROGRESS")
-        redis_client.publish(status_channel, "IN_PROGRESS")
-        asyncio.run(send_status_webhook(job_id, "IN_PROGRESS"))
-
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            env=env
-        )
-
-        # Read subprocess output
+        if concurrency:
+            cmd += ["--concurrency", str(concurrency)]
+
+        if not headless:
+            cmd += ["--headed"]
+
+        # A redelivered or retried job skips the tasks an earlier attempt completed
+        if resume:
+            completed_tasks = redis_client.hlen(checkpoint_key(job_id))
+            cmd += ["--resume"]
+            capture.log(f"[INFO] Resuming job (attempt {attempt}), {completed_tasks} tasks already completed")
+
+        # Hand the job a pre-launched browser; the agent opens its own contexts in it
+        if headless and BROWSER_POOL_SIZE > 0:
+            try:
+                pooled_browser = browser_pool.acquire()
+                cmd += ["--cdp-url", pooled_browser.cdp_url]
+            except Exception as e:
+                capture.log(f"[WARN] Browser pool unavailable, agent will launch its own browser: {e}")
+
+        set_job_status(job_id, "IN_PROGRESS")
+
+        # Structured progress events arrive on their own pipe, apart from the log
+        progress = ProgressRelay(redis_client, job_id)
+        cmd += ["--events-fd", str(progress.write_fd)]
+        process = start_agent_process(cmd, env, pass_fds=(progress.write_fd,))
+        progress.start()
+
+        # Read stdout and stderr concurrently so neither pipe can fill up and block the agent
         if process.stdout:
-            for line in process.stdout:
-                cleaned = clean_log(line)
-                log_message(log_channel, cleaned)
-
+            capture.attach(process.stdout)
         if process.stderr:
-            for err in process.stderr:
-                err_clean = f"[stderr] {clean_log(err)}"
-                log_message(log_channel, err_clean)
+            capture.attach(process.stderr, prefix="[stderr] ")
+        capture.wait_for_pipes()
+        progress.close()
+        capture.log(f"[INFO] Progress events relayed: {progress.events}")
 
         process.wait()
 
         if process.returncode == 0:
-            redis_client.set(f"status:{job_id}", "POST_PROCESS")
-            redis_client.publish(status_channel, "POST_PROCESS")
-            log_message(log_channel, "[DONE]")
-            asyncio.run(send_status_webhook(job_id, "POST_PROCESS"))
+            clear_checkpoints(redis_client, job_id)
+            set_job_status(job_id, "POST_PROCESS")
+            capture.log("[DONE]")
         else:
             error_status = f"[ERROR] Exit code {process.returncode}"
-            redis_client.set(f"status:{job_id}", "FAILED")
-            redis_client.publish(status_channel, "FAILED")
-            log_message(log_channel, error_status)
-            asyncio.run(send_status_webhook(job_id, "FAILED"))
+            set_job_status(job_id, "FAILED")
+            capture.log(error_status)
 
         return {"status": "completed", "job_id": job_id}
 
     except Exception as e:
         error_message = f"[EXCEPTION] {str(e)}"
-        redis_client.set(f"status:{job_id}", "FAILED")
-        redis_client.publish(status_channel, "FAILED")
-        asyncio.run(send_status_webhook(job_id, "FAILED"))
-        log_message(log_channel, error_message)
+        set_job_status(job_id, "FAILED")
+        capture.log(error_message)
         return {"status": "failed", "error": str(e)}
 
     finally:
+        if progress and not progress.started:
+            progress.close()
+        if pooled_browser:
+            try:
+                browser_pool.release(pooled_browser)
+                stats = browser_pool.stats()
+                redis_client.hset(f"browser_pool:{socket.gethostname()}:{os.getpid()}", mapping=stats)
+                capture.log(f"[INFO] Browser pool stats: {stats}")
+            except Exception as pool_error:
+                capture.log(f"[WARN] Failed to return browser to pool: {pool_error}")
         try:
-            if xvfb_proc:
-                xvfb_proc.terminate()
-                xvfb_proc.wait()
-                log_message(log_channel, "[INFO] Xvfb terminated")
+            if xvfb_display:
+                xvfb_pool.release(xvfb_display)
+                capture.log(f"[INFO] Released Xvfb display {xvfb_display.display}")
         except Exception as cleanup_error:
-            log_message(log_channel, f"[WARN] Failed to clean up Xvfb: {cleanup_error}")
+            capture.log(f"[WARN] Failed to clean up Xvfb: {cleanup_error}")
+        capture.log(f"[INFO] Log capture stats: {capture.stats()}")
+        capture.close()
@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import time
+
+from messages.celery_worker import celery_app
+from screenshot.cache import FRAME_CACHE_STATS_KEY, get_frame_cache
+from screenshot.events import build_filters, extract_event_offsets
+from screenshot.generate import VideoFrameExtractor
+# Module import: tasks.evaluation may still be initializing when the worker module pulls this one in
+from tasks import evaluation
+from utils.progress_relay import publish_progress
+
+# How long a finished extraction job stays downloadable
+SCREENSHOT_RESULT_TTL = int(os.getenv("SCREENSHOT_RESULT_TTL", str(24 * 3600)))
+
+
+def screenshot_result_key(job_id: str) -> str:
+    return f"screenshots:{job_id}"
+
+
+def set_status(job_id: str, status: str):
+    """Store and publish the status of a screenshot job on the /status/{job_id} channel."""
+    pipe = evaluation.redis_client.pipeline(transaction=False)
+    pipe.set(f"status:{job_id}", status)
+    pipe.publish(f"status:{job_id}", status)
+    pipe.execute()
+
+
+@celery_app.task(bind=True, name="tasks.screenshots.generate_screenshots")
+def generate_screenshots(self, job_id, video_file, jsonl_file, output_dir, events=None):
+    """
+    Extract frames of a recording at the selected events and zip them.
+
+    Reports its status on `status:{job_id}` and its stages (events, frames,
+    archive) as progress events; the outcome, including the path of the zip,
+    is kept under `screenshots:{job_id}` for the download route.
+
+    When the frame cache holds the same video, event log and filters, its zip
+    is returned without fetching the log or decoding anything; `output_dir`
+    then only gets the zip next to it, not the individual frames.
+    """
+    started = time.time()
+    events = events or ["clicks"]
+    set_status(job_id, "STARTED")
+    publish_progress(evaluation.redis_client, job_id, "job_start", video=video_file, events=events)
+    result = {"jobId": job_id, "output_dir": output_dir}
+    try:
+        cache, cache_key, cached = get_frame_cache(), None, None
+        if cache:
+            try:
+                cache_key = cache.key_for(video_file, jsonl_file, events)
+                cached = cache.get(cache_key, os.path.abspath(f"{output_dir}.zip"))
+                evaluation.redis_client.hincrby(FRAME_CACHE_STATS_KEY, "hits" if cached is not None else "misses", 1)
+                publish_progress(evaluation.redis_client, job_id, "cache", hit=cached is not None)
+                print(f"[INFO] Frame cache: {cache.stats()}")
+            except Exception as e:
+                print(f"[WARN] Frame cache unavailable for job {job_id}: {e}")
+
+        if cached is not None:
+            result.update(cached, zip_path=os.path.abspath(f"{output_dir}.zip"), cache="hit")
+        else:
+            result.update(extract_frames(job_id, video_file, jsonl_file, output_dir, events))
+            if cache_key:
+                result["cache"] = "miss"
+                try:
+                    cache.put(cache_key, result["zip_path"], {"events": result["events"], "frames": result["frames"]})
+                except Exception as e:
+                    print(f"[WARN] Could not cache frames of job {job_id}: {e}")
+        result["status"] = "COMPLETED"
+    except Exception as e:
+        print(f"[EXCEPTION] Screenshot job {job_id} failed: {e}")
+        result["status"] = "FAILED"
+        result["error"] = str(e)
+
+    return finish_job(job_id, result, started)
+
+
+def extract_frames(job_id: str, video_file: str, jsonl_file: str, output_dir: str, events: list[str]) -> dict:
+    # Unlike TimestampExtractor, let an unreadable log fail the job
+    offsets = extract_event_offsets(jsonl_file, build_filters(events))
+    publish_progress(evaluation.redis_client, job_id, "events", count=len(offsets))
+    set_status(job_id, "IN_PROGRESS")
+
+    os.makedirs(output_dir, exist_ok=True)
+    frames = 0
+    if offsets:
+        with VideoFrameExtractor(video_file, output_dir) as frame_extractor:
+            frames = frame_extractor.extract_frames(offsets)
+    publish_progress(evaluation.redis_client, job_id, "frames", extracted=frames, requested=len(offsets))
+
+    # A cache hit of an earlier job may have hard-linked this path to a cache
+    # entry; make_archive would rewrite that entry in place
+    if os.path.lexists(f"{output_dir}.zip"):
+        os.remove(f"{output_dir}.zip")
+    zip_path = shutil.make_archive(output_dir, "zip", output_dir)
+    return {"events": len(offsets), "frames": frames, "zip_path": zip_path}
+
+
+def finish_job(job_id: str, result: dict, started: float) -> dict:
+    result["seconds"] = round(time.time() - started, 2)
+    evaluation.redis_client.set(screenshot_result_key(job_id), json.dumps(result), ex=SCREENSHOT_RESULT_TTL)
+    publish_progress(evaluation.redis_client, job_id, "job_end", status=result["status"], frames=result.get("frames", 0),
+                     seconds=result["seconds"])
+    set_status(job_id, result["status"])
+    return result
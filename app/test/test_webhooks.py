@@ -0,0 +1,134 @@
+"""
+Webhook outbox delivery against fakeredis and a mocked webhook endpoint.
+
+Run from the app directory:
+    python -m pytest test/test_webhooks.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import webhooks
+from utils.webhooks import DEAD_LETTER_KEY, DUE_KEY, OUTBOX_KEY, WebhookDispatcher, lease_key, queue_status_webhook
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_BACKOFF_SECONDS", 0)
+
+
+def dispatcher_for(handler, max_attempts=3):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return WebhookDispatcher(url="http://hooks.test/webhook", redis=redis, client=client,
+                             max_attempts=max_attempts, poll_seconds=0)
+
+
+async def queue(redis, job_id, status):
+    async with redis.pipeline(transaction=False) as pipe:
+        queue_status_webhook(pipe, job_id, status)
+        await pipe.execute()
+
+
+async def drain(dispatcher):
+    """Dispatch until nothing is due, waiting for every delivery."""
+    while await dispatcher.dispatch_due():
+        await asyncio.gather(*dispatcher._deliveries)
+
+
+def test_retries_server_errors_until_delivered():
+    calls = []
+
+    def handler(request):
+        calls.append(json.loads(request.content))
+        return httpx.Response(503 if len(calls) < 3 else 200)
+
+    async def run():
+        dispatcher = dispatcher_for(handler)
+        await queue(dispatcher._redis, "job-1", "COMPLETED")
+        await drain(dispatcher)
+        assert dispatcher.stats == {"delivered": 1, "retried": 2, "dead": 0}
+        assert await dispatcher._redis.hlen(OUTBOX_KEY) == 0
+        assert not await dispatcher._redis.exists(lease_key("job-1"))
+
+    asyncio.run(run())
+    assert calls == [{"type": "job_status", "payload": {"status": "COMPLETED", "id": "job-1"}}] * 3
+
+
+def test_only_latest_status_is_sent():
+    statuses = []
+
+    def handler(request):
+        statuses.append(json.loads(request.content)["payload"]["status"])
+        return httpx.Response(200)
+
+    async def run():
+        dispatcher = dispatcher_for(handler)
+        for status in ("QUEUED", "STARTED", "COMPLETED"):
+            await queue(dispatcher._redis, "job-1", status)
+        await drain(dispatcher)
+
+    asyncio.run(run())
+    assert statuses == ["COMPLETED"]
+
+
+def test_newer_status_waits_for_delivery_in_flight():
+    statuses = []
+    release = asyncio.Event()
+
+    async def handler(request):
+        statuses.append(json.loads(request.content)["payload"]["status"])
+        if len(statuses) == 1:
+            await release.wait()
+        return httpx.Response(200)
+
+    async def run():
+        # Two API processes sharing one Redis
+        first = dispatcher_for(handler)
+        second = dispatcher_for(handler)
+        second._redis = first._redis
+        await queue(first._redis, "job-1", "STARTED")
+        assert await first.dispatch_due() == 1
+        await asyncio.sleep(0)
+
+        await queue(first._redis, "job-1", "COMPLETED")
+        assert await second.dispatch_due() == 0
+        assert await first.dispatch_due() == 0
+        assert await first._redis.zscore(DUE_KEY, "job-1") is not None
+
+        release.set()
+        await asyncio.gather(*first._deliveries)
+        await drain(second)
+
+    asyncio.run(run())
+    assert statuses == ["STARTED", "COMPLETED"]
+
+
+def test_dead_letters_client_errors_and_exhausted_retries():
+    def handler(request):
+        job_id = json.loads(request.content)["payload"]["id"]
+        return httpx.Response(400 if job_id == "rejected" else 500)
+
+    async def run():
+        dispatcher = dispatcher_for(handler, max_attempts=2)
+        await queue(dispatcher._redis, "rejected", "FAILED")
+        await queue(dispatcher._redis, "unreachable", "FAILED")
+        await drain(dispatcher)
+        assert dispatcher.stats == {"delivered": 0, "retried": 1, "dead": 2}
+        assert await dispatcher._redis.hlen(OUTBOX_KEY) == 0
+        return [json.loads(raw) for raw in await dispatcher._redis.lrange(DEAD_LETTER_KEY, 0, -1)]
+
+    dead = {event["jobId"]: event for event in asyncio.run(run())}
+    assert dead["rejected"]["attempts"] == 1
+    assert dead["rejected"]["last_error"].startswith("HTTP 400")
+    assert dead["unreachable"]["attempts"] == 2
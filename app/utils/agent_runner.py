@@ -0,0 +1,205 @@
+import fcntl
+import io
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+from multiprocessing import forkserver, reduction, resource_tracker
+from typing import Callable
+
+# "subprocess" starts a fresh interpreter per job, "fork" forks the job from a pre-imported zygote
+AGENT_EXEC_MODE = os.getenv("AGENT_EXEC_MODE", "subprocess")
+# Imported once by the zygote, before it forks any job
+AGENT_PRELOAD_MODULES = ["agents.browseruse"]
+
+_zygote = multiprocessing.get_context("forkserver")
+
+
+def _zygote_supported() -> bool:
+    """
+    Whether this interpreter has the private multiprocessing attributes that
+    `_install_fds` moves out of the way. Checked against CPython 3.10 to 3.13;
+    anything else falls back to a subprocess per job.
+    """
+    tracker = getattr(resource_tracker, "_resource_tracker", None)
+    server = getattr(forkserver, "_forkserver", None)
+    return (
+        sys.implementation.name == "cpython"
+        and "forkserver" in multiprocessing.get_all_start_methods()
+        and hasattr(reduction, "DupFd")
+        and hasattr(tracker, "_fd")
+        and hasattr(server, "_forkserver_alive_fd")
+    )
+
+
+ZYGOTE_SUPPORTED = _zygote_supported()
+
+
+def preload_agent():
+    """
+    Start this worker's zygote and have it import the agent module, and with
+    it langchain, browser_use and the google-cloud clients.
+
+    The zygote is multiprocessing's fork server: a fresh interpreter started
+    with exec, not a fork of the worker, so it runs no threads, holds no
+    locks and shares no connections when it forks a job. Call it early, e.g.
+    from `worker_process_init`; later calls are no-ops.
+    """
+    if not ZYGOTE_SUPPORTED:
+        print(f"[WARN] No agent zygote on {sys.implementation.name} {sys.version.split()[0]}, "
+              "jobs run in a subprocess each")
+        return
+    _zygote.set_forkserver_preload(AGENT_PRELOAD_MODULES)
+    forkserver.ensure_running()
+
+
+def _run_agent(argv: list[str]) -> int:
+    from agents.browseruse import main
+    return main(argv)
+
+
+def _detach(fd) -> int:
+    return fd.detach()
+
+
+class _ChildFd:
+    """A descriptor handed to the zygote's child while it is being started, see `reduction.DupFd`."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def __reduce__(self):
+        return _detach, (reduction.DupFd(self.fd),)
+
+
+def _lift(fd: int, floor: int) -> int:
+    lifted = fcntl.fcntl(fd, fcntl.F_DUPFD, floor)
+    os.close(fd)
+    return lifted
+
+
+def _install_fds(fds: list[int], numbers: list[int]):
+    """Make each of `fds` available under its number, moving multiprocessing's own descriptors out of the way."""
+    # Above every target first, so installing one cannot overwrite another
+    floor = max(numbers) + 1
+    fds = [_lift(fd, floor) for fd in fds]
+    tracker = resource_tracker._resource_tracker
+    server = forkserver._forkserver
+    for fd, number in zip(fds, numbers):
+        if tracker._fd == number:
+            tracker._fd = fcntl.fcntl(number, fcntl.F_DUPFD, floor)
+        if server._forkserver_alive_fd == number:
+            server._forkserver_alive_fd = fcntl.fcntl(number, fcntl.F_DUPFD, floor)
+        os.dup2(fd, number)
+        os.close(fd)
+
+
+def _run_child(target, args, env, stdout_w: int, stderr_w: int, inherited: list[tuple[int, int]]):
+    # Undo the worker's signal handling so terminate() behaves like for a subprocess
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    _install_fds([stdout_w, stderr_w] + [fd for _, fd in inherited], [1, 2] + [number for number, _ in inherited])
+    if env is not None:
+        os.environ.clear()
+        os.environ.update(env)
+
+    # Point Python level output, including log handlers configured while
+    # the zygote imported the agent, at the pipes, line buffered
+    old_stdout = (sys.stdout, sys.__stdout__)
+    old_stderr = (sys.stderr, sys.__stderr__)
+    sys.stdout = io.TextIOWrapper(io.FileIO(1, "w", closefd=False), line_buffering=True)
+    sys.stderr = io.TextIOWrapper(io.FileIO(2, "w", closefd=False), line_buffering=True)
+    loggers = [logging.getLogger()] + [
+        logger for logger in logging.root.manager.loggerDict.values()
+        if isinstance(logger, logging.Logger)
+    ]
+    for logger in loggers:
+        for handler in logger.handlers:
+            if not isinstance(handler, logging.StreamHandler):
+                continue
+            if any(handler.stream is stream for stream in old_stdout):
+                handler.setStream(sys.stdout)
+            elif any(handler.stream is stream for stream in old_stderr):
+                handler.setStream(sys.stderr)
+
+    # multiprocessing turns the exit status, an exception's traceback included, into the exit code
+    sys.exit(target(*args) or 0)
+
+
+class ForkedAgentProcess:
+    """
+    Runs `target(*args)` in a child forked from the worker's zygote (see `preload_agent`).
+
+    Nothing of the worker itself is forked: not its threads, such as the log
+    capture writer or the browser pool refill, nor its Redis connections.
+    The child gets its own pid, memory and stdio pipes, so a crashing job
+    cannot take the worker down with it, and `pass_fds` stay open in it
+    under the same numbers. It mirrors the parts of `subprocess.Popen` that
+    `run_browser_task` uses. `target` must be importable by name.
+    """
+
+    def __init__(self, target: Callable[..., int], args: tuple = (), env: dict | None = None,
+                 pass_fds: tuple[int, ...] = ()):
+        preload_agent()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        try:
+            self._process = _zygote.Process(
+                target=_run_child,
+                args=(target, args, env, _ChildFd(stdout_w), _ChildFd(stderr_w),
+                      [(fd, _ChildFd(fd)) for fd in pass_fds]),
+                daemon=False
+            )
+            self._process.start()
+        except BaseException:
+            os.close(stdout_r)
+            os.close(stderr_r)
+            raise
+        finally:
+            os.close(stdout_w)
+            os.close(stderr_w)
+
+        self.pid = self._process.pid
+        self.returncode: int | None = None
+        self.stdout = io.open(stdout_r, "r", encoding="utf-8", errors="replace")
+        self.stderr = io.open(stderr_r, "r", encoding="utf-8", errors="replace")
+
+    def poll(self) -> int | None:
+        if self.returncode is None:
+            self.returncode = self._process.exitcode
+        return self.returncode
+
+    def wait(self) -> int:
+        if self.returncode is None:
+            self._process.join()
+            self.returncode = self._process.exitcode
+        return self.returncode
+
+    def terminate(self):
+        if self.poll() is None:
+            self._process.terminate()
+
+    def kill(self):
+        if self.poll() is None:
+            self._process.kill()
+
+
+def start_agent_process(argv: list[str], env: dict, pass_fds: tuple[int, ...] = ()):
+    """
+    Start the browser agent with the given CLI arguments in the configured mode.
+
+    `pass_fds` stay open in the agent under the same numbers.
+    """
+    if AGENT_EXEC_MODE == "fork" and ZYGOTE_SUPPORTED:
+        return ForkedAgentProcess(_run_agent, (argv,), env, pass_fds)
+    return subprocess.Popen(
+        [sys.executable, "-m", "agents.browseruse", *argv],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=env,
+        pass_fds=pass_fds
+    )
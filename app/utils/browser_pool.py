@@ -0,0 +1,198 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import psutil
+
+CHROME_PATH = os.getenv("CHROME_PATH") or shutil.which("google-chrome") or shutil.which("chromium") or "google-chrome"
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "1"))
+BROWSER_POOL_MAX_USES = int(os.getenv("BROWSER_POOL_MAX_USES", "20"))
+BROWSER_POOL_MAX_RSS_MB = int(os.getenv("BROWSER_POOL_MAX_RSS_MB", "1536"))
+BROWSER_LAUNCH_TIMEOUT = float(os.getenv("BROWSER_LAUNCH_TIMEOUT", "20"))
+
+
+class PooledBrowser:
+    """A headless Chromium process that jobs reach through its CDP endpoint."""
+
+    def __init__(self, process: subprocess.Popen, profile_dir: str, cdp_url: str):
+        self.process = process
+        self.profile_dir = profile_dir
+        self.cdp_url = cdp_url
+        self.uses = 0
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def rss_bytes(self) -> int:
+        """Resident memory of the browser and all of its renderer/GPU children."""
+        try:
+            parent = psutil.Process(self.process.pid)
+            processes = [parent] + parent.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return 0
+        total = 0
+        for proc in processes:
+            try:
+                total += proc.memory_info().rss
+            except psutil.NoSuchProcess:
+                continue
+        return total
+
+    def close(self):
+        try:
+            if self.is_alive():
+                self.process.terminate()
+                try:
+                    self.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+                    self.process.wait()
+        finally:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class BrowserPool:
+    """
+    Keeps pre-launched headless browsers around so jobs skip Chromium cold start.
+
+    Jobs never share state through the pool: the agent connects over CDP and
+    opens a fresh incognito context per task. A browser is recycled once it
+    has served `max_uses` jobs or grows beyond `max_rss_mb`.
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_uses: int = BROWSER_POOL_MAX_USES,
+                 max_rss_mb: int = BROWSER_POOL_MAX_RSS_MB):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self._idle: list[PooledBrowser] = []
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "launches": 0,
+            "launch_failures": 0,
+            "recycled": 0,
+            "launch_seconds_total": 0.0,
+            "last_launch_seconds": 0.0,
+        }
+
+    def _launch(self) -> PooledBrowser:
+        profile_dir = tempfile.mkdtemp(prefix="browser-pool-")
+        started = time.monotonic()
+        try:
+            process = subprocess.Popen(
+                [
+                    CHROME_PATH,
+                    "--headless=new",
+                    "--remote-debugging-port=0",
+                    f"--user-data-dir={profile_dir}",
+                    "--no-first-run",
+                    "--no-default-browser-check",
+                    "--no-sandbox",
+                    "--disable-dev-shm-usage",
+                    "about:blank",
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        except Exception as e:
+            # e.g. no Chromium at CHROME_PATH
+            shutil.rmtree(profile_dir, ignore_errors=True)
+            self._launch_failed()
+            raise RuntimeError(f"Could not start Chromium ({CHROME_PATH}): {e}") from e
+
+        # Chrome writes the chosen port and browser path once DevTools is listening
+        port_file = os.path.join(profile_dir, "DevToolsActivePort")
+        while time.monotonic() - started < BROWSER_LAUNCH_TIMEOUT:
+            if process.poll() is not None:
+                break
+            try:
+                with open(port_file) as f:
+                    port, path = f.read().split("\n")[:2]
+                if port and path:
+                    elapsed = time.monotonic() - started
+                    with self._lock:
+                        self._stats["launches"] += 1
+                        self._stats["launch_seconds_total"] += elapsed
+                        self._stats["last_launch_seconds"] = elapsed
+                    return PooledBrowser(process, profile_dir, f"ws://127.0.0.1:{port}{path}")
+            except (FileNotFoundError, ValueError):
+                pass
+            time.sleep(0.05)
+
+        PooledBrowser(process, profile_dir, "").close()
+        self._launch_failed()
+        raise RuntimeError(f"Chromium did not start within {BROWSER_LAUNCH_TIMEOUT}s ({CHROME_PATH})")
+
+    def _launch_failed(self):
+        with self._lock:
+            self._stats["launch_failures"] += 1
+
+    def warm(self):
+        """Launch browsers until `size` of them are idle."""
+        while True:
+            with self._lock:
+                if len(self._idle) >= self.size:
+                    return
+            browser = self._launch()
+            with self._lock:
+                self._idle.append(browser)
+
+    def acquire(self) -> PooledBrowser:
+        """Hand out an idle browser, launching a new one on a pool miss."""
+        with self._lock:
+            while self._idle:
+                browser = self._idle.pop()
+                if browser.is_alive():
+                    self._stats["hits"] += 1
+                    return browser
+                browser.close()
+            self._stats["misses"] += 1
+        return self._launch()
+
+    def release(self, browser: PooledBrowser):
+        """Return a browser after a job, recycling it if it is worn out."""
+        browser.uses += 1
+        worn_out = (
+            not browser.is_alive()
+            or browser.uses >= self.max_uses
+            or browser.rss_bytes() >= self.max_rss_bytes
+        )
+        with self._lock:
+            if not worn_out and len(self._idle) < self.size:
+                self._idle.append(browser)
+                return
+            self._stats["recycled"] += 1
+        browser.close()
+        # Replace it off the job's critical path
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self):
+        try:
+            self.warm()
+        except Exception as e:
+            print(f"[WARN] Browser pool refill failed: {e}")
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for browser in idle:
+            browser.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["avg_launch_seconds"] = round(stats["launch_seconds_total"] / stats["launches"], 3) if stats["launches"] else 0.0
+        return stats
+
+
+# One pool per Celery worker process
+browser_pool = BrowserPool()
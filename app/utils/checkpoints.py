@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+import time
+
+from utils.redis_client import get_redis
+
+# How long completion records of a job are kept for a resume
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", str(7 * 24 * 3600)))
+# Deliveries of one submission before it is failed; acks_late redelivers a job whose worker died
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+
+def checkpoint_key(job_id: str) -> str:
+    return f"checkpoint:{job_id}"
+
+
+def attempts_key(job_id: str) -> str:
+    return f"attempts:{job_id}"
+
+
+def clear_checkpoints(redis, job_id: str):
+    """Forget a job's completion records and attempt count; `redis` is a client or pipeline, sync or async."""
+    return redis.delete(checkpoint_key(job_id), attempts_key(job_id))
+
+
+def start_attempt(redis_client, job_id: str) -> int:
+    """Count a delivery of the job on a sync client. Returns its attempt number, 1 for a new submission."""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.incr(attempts_key(job_id))
+    pipe.expire(attempts_key(job_id), CHECKPOINT_TTL)
+    return int(pipe.execute()[0])
+
+
+class TaskCheckpoints:
+    """
+    Completion records of a job's tasks, so a redelivered job can skip them.
+
+    Records live in the Redis hash `checkpoint:{jobId}`, one field per taskId.
+    A task is only recorded once its result is committed to Firestore and its
+    archive is uploaded, i.e. once rerunning it would gain nothing.
+    """
+
+    def __init__(self, job_id: str, redis=None, ttl: int = CHECKPOINT_TTL):
+        self.key = checkpoint_key(job_id)
+        self.ttl = ttl
+        self._redis = redis
+        self._marks: set[asyncio.Task] = set()
+
+    def _client(self):
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    async def load(self) -> dict[str, dict]:
+        """Records of the tasks already completed by an earlier attempt, by taskId."""
+        try:
+            records = await self._client().hgetall(self.key)
+        except Exception as e:
+            print(f"Error loading checkpoints from {self.key}, running every task: {e}")
+            return {}
+        return {task_id: json.loads(record) for task_id, record in records.items()}
+
+    def mark_when_uploaded(self, task_id: str, upload: asyncio.Task):
+        """Record `task_id` as completed once its archive upload has succeeded."""
+        mark = asyncio.create_task(self._mark(task_id, upload))
+        self._marks.add(mark)
+        mark.add_done_callback(self._marks.discard)
+
+    async def _mark(self, task_id: str, upload: asyncio.Task):
+        outcome = await upload
+        if outcome.get("upload") != "uploaded":
+            return
+        record = {"archive": outcome.get("archive"), "completed_at": time.time()}
+        try:
+            async with self._client().pipeline(transaction=True) as pipe:
+                pipe.hset(self.key, task_id, json.dumps(record))
+                pipe.expire(self.key, self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Error checkpointing task {task_id}: {e}")
+
+    async def wait(self):
+        """Wait until every pending record is written."""
+        if self._marks:
+            await asyncio.gather(*self._marks)
@@ -1,11 +1,12 @@
 from re import compile
 
+# Regex to match ANSI escape codes, compiled once for every line logged
+ANSI_ESCAPE = compile(r'(?:\x1B[@-Z\\-_]|\x1B\[[0-?]*[ -/]*[@-~])')
+
 def clean_log(log: str) -> str:
     """
     Remove ANSI escape codes and unnecessary whitespace from the log.
     """
-    # Regex to match ANSI escape codes
-    ansi_escape = compile(r'(?:\x1B[@-Z\\-_]|\x1B\[[0-?]*[ -/]*[@-~])')
     # Remove ANSI codes and strip extra whitespace
-    clean_line = ansi_escape.sub('', log).strip()
-    return clean_line
\ No newline at end of file
+    clean_line = ANSI_ESCAPE.sub('', log).strip()
+    return clean_line
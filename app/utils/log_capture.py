@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+import time
+from typing import IO
+
+from utils.clean_log import clean_log
+
+# Approximate number of log lines kept per job stream
+LOG_STREAM_MAXLEN = int(os.getenv("LOG_STREAM_MAXLEN", "20000"))
+# A batch is written once it has this many lines or is this old, whichever comes first
+LOG_BATCH_LINES = int(os.getenv("LOG_BATCH_LINES", "50"))
+LOG_FLUSH_MS = int(os.getenv("LOG_FLUSH_MS", "200"))
+
+_STOP = object()
+
+
+class LogCapture:
+    """
+    Collects job log lines and writes them to the job's Redis stream in batches.
+
+    Each attached pipe is drained by its own thread, so a chatty stderr can
+    never fill up while stdout is being read. A single writer thread sends
+    the buffered lines in one Redis pipeline per batch.
+    """
+
+    def __init__(self, redis_client, stream: str, batch_lines: int = LOG_BATCH_LINES,
+                 flush_ms: int = LOG_FLUSH_MS, maxlen: int = LOG_STREAM_MAXLEN):
+        self.redis_client = redis_client
+        self.stream = stream
+        self.batch_lines = batch_lines
+        self.flush_seconds = flush_ms / 1000
+        self.maxlen = maxlen
+        self._queue: queue.Queue = queue.Queue()
+        self._readers: list[threading.Thread] = []
+        self._started = time.monotonic()
+        self._lines = 0
+        self._flushes = 0
+        self._flush_seconds_total = 0.0
+        self._flush_seconds_max = 0.0
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def log(self, message: str):
+        self._queue.put(message)
+
+    def attach(self, pipe: IO[str], prefix: str = ""):
+        """Start draining `pipe`, logging every cleaned line with `prefix`."""
+        def read():
+            for line in pipe:
+                self.log(f"{prefix}{clean_log(line)}")
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        self._readers.append(reader)
+
+    def wait_for_pipes(self):
+        """Block until every attached pipe has reached EOF."""
+        for reader in self._readers:
+            reader.join()
+
+    def close(self):
+        """Drain the pipes and write out everything still buffered."""
+        self.wait_for_pipes()
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def _write_loop(self):
+        batch: list[str] = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_seconds
+                batch.append(item)
+                if len(batch) < self.batch_lines and time.monotonic() < deadline:
+                    continue
+            self._flush(batch)
+            batch = []
+
+    def _flush(self, batch: list[str]):
+        if not batch:
+            return
+        started = time.monotonic()
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for line in batch:
+                pipe.xadd(self.stream, {"line": line}, maxlen=self.maxlen, approximate=True)
+            pipe.execute()
+        except Exception as e:
+            print(f"[WARN] Dropped {len(batch)} log lines for {self.stream}: {e}")
+            return
+        elapsed = time.monotonic() - started
+        self._lines += len(batch)
+        self._flushes += 1
+        self._flush_seconds_total += elapsed
+        self._flush_seconds_max = max(self._flush_seconds_max, elapsed)
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._started
+        return {
+            "lines": self._lines,
+            "lines_per_second": round(self._lines / elapsed, 1) if elapsed else 0.0,
+            "flushes": self._flushes,
+            "avg_flush_ms": round(self._flush_seconds_total / self._flushes * 1000, 2) if self._flushes else 0.0,
+            "max_flush_ms": round(self._flush_seconds_max * 1000, 2),
+        }
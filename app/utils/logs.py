@@ -1,47 +1,69 @@
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import StreamingResponse
-import redis.asyncio as aioredis
-import asyncio, io
+import io
+from utils.pubsub_hub import stream_hub, parse_stream_id, SlowClientError
+from utils.redis_client import get_redis
 
 router = APIRouter()
 
-REDIS_URL = "redis://10.115.18.147:6379/0"  # adjust for your Redis connection
+# Entries fetched per XRANGE call while replaying a backlog
+LOG_REPLAY_BATCH = 1000
 
-async def event_generator(job_id: str):
-    redis = await aioredis.from_url(REDIS_URL, decode_responses=True)
-    pubsub = redis.pubsub()
-    channel = f"log:{job_id}"
+
+async def legacy_log_lines(job_id: str) -> list[str]:
+    """Log of a job that ran before logs moved to streams, kept in the `log:{job_id}` list."""
+    return await get_redis().lrange(f"log:{job_id}", 0, -1) # type: ignore
+
+async def event_generator(job_id: str, last_event_id: str | None = None):
+    stream = f"logstream:{job_id}"
+    # Subscribe before reading the backlog so no line falls between the two
+    subscription = stream_hub.subscribe(stream)
 
     try:
-        # Step 1: Replay rpush history
-        log_history = await redis.lrange(channel, 0, -1) # type: ignore
-        for entry in log_history:
-            yield f"data: {entry}\n\n"
+        # Step 1: Replay what the client has not seen yet; "(" makes the start exclusive
+        start = f"({last_event_id}" if last_event_id else "-"
+        last_id = last_event_id or "0-0"
+        while True:
+            backlog = await get_redis().xrange(stream, min=start, count=LOG_REPLAY_BATCH)
+            for entry_id, fields in backlog:
+                yield f"id: {entry_id}\ndata: {fields.get('line', '')}\n\n"
+                last_id = entry_id
+            if len(backlog) < LOG_REPLAY_BATCH:
+                break
+            start = f"({last_id}"
+        if not last_event_id and last_id == "0-0":
+            # Nothing in the stream; the job may predate it
+            for line in await legacy_log_lines(job_id):
+                yield f"data: {line}\n\n"
 
-        # Step 2: Subscribe to real-time logs
-        await pubsub.subscribe(channel)
+        # Step 2: Stream real-time logs
+        stream_hub.watch(stream, last_id)
+        seen = parse_stream_id(last_id)
         while True:
-            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=10)
-            if message:
-                data = message["data"]
-                print(data)
-                yield f"data: {data}\n\n"
-            else:
+            entry = await subscription.get()
+            if entry is None:
                 # Keep the connection alive
                 yield ": keep-alive\n\n"
-            await asyncio.sleep(0.1)
+                continue
+            entry_id, fields = entry
+            if parse_stream_id(entry_id) <= seen:
+                continue
+            seen = parse_stream_id(entry_id)
+            yield f"id: {entry_id}\ndata: {fields.get('line', '')}\n\n"
+    except SlowClientError:
+        yield ": disconnected, client too slow\n\n"
     finally:
-        await pubsub.unsubscribe(channel)
-        await pubsub.close()
-        await redis.close()
+        stream_hub.unsubscribe(subscription)
 
 @router.get("/download-logs/{job_id}")
 async def download_logs(job_id: str):
-    redis = aioredis.from_url(REDIS_URL, decode_responses=True)
-    channel = f"log:{job_id}"
+    redis = get_redis()
+    stream = f"logstream:{job_id}"
 
-    # Fetch logs from Redis list
-    log_entries = await redis.lrange(channel, 0, -1) # type: ignore
+    # Fetch logs from the job's Redis stream
+    log_entries = [fields.get("line", "") for _, fields in await redis.xrange(stream)]
+    if not log_entries:
+        log_entries = await legacy_log_lines(job_id)
 
     if not log_entries:
         raise HTTPException(status_code=404, detail="No logs found for this job ID")
@@ -59,8 +81,9 @@ async def download_logs(job_id: str):
 
 @router.get("/logs/{job_id}")
 async def status_stream(request: Request, job_id: str):
-    # StreamingResponse for SSE
-    generator = event_generator(job_id)
+    # A reconnecting EventSource sends the ID of the last entry it received
+    last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+    generator = event_generator(job_id, last_event_id)
 
     async def event_streamer():
         async for event in generator:
@@ -0,0 +1,58 @@
+import json
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from utils.pubsub_hub import hub, SlowClientError
+from utils.redis_client import get_redis
+
+router = APIRouter()
+
+
+async def event_generator(job_id: str):
+    channel = f"progress:{job_id}"
+    # Subscribe before reading the snapshot so no event falls between the two
+    subscription = hub.subscribe(channel)
+    try:
+        # Latest event per (event, taskId), oldest first
+        snapshot = await get_redis().hvals(channel)
+        for line in sorted(snapshot, key=lambda line: json.loads(line).get("ts", 0)):
+            yield f"data: {line}\n\n"
+
+        while True:
+            data = await subscription.get()
+            if data is not None:
+                yield f"data: {data}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+    except SlowClientError:
+        yield ": disconnected, client too slow\n\n"
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@router.get("/progress/{job_id}")
+async def progress_stream(request: Request, job_id: str):
+    """
+    Structured progress of a job as server-sent events, one JSON object each:
+    job_start/job_end, task_start/task_end, step (number, actions, url),
+    replay, and llm (model, latency_ms, input/output/total tokens).
+    """
+    generator = event_generator(job_id)
+
+    async def event_streamer():
+        async for event in generator:
+            # If client disconnects, exit
+            if await request.is_disconnected():
+                break
+            yield event
+
+    headers = {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        # Prevents some proxies from buffering SSE
+        "X-Accel-Buffering": "no",
+    }
+
+    return StreamingResponse(event_streamer(), headers=headers)
@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+import time
+
+# How long the latest progress of a job stays readable after its last event
+PROGRESS_TTL = int(os.getenv("PROGRESS_TTL", str(24 * 3600)))
+
+
+def progress_key(job_id: str) -> str:
+    return f"progress:{job_id}"
+
+
+def queue_progress(pipe, job_id: str, line: str, event: dict, ttl: int = PROGRESS_TTL):
+    """
+    Add a progress event to a Redis pipeline: publish it on the job's channel
+    and keep it as the latest event per (event, taskId) in the job's hash.
+    """
+    key = progress_key(job_id)
+    field = event.get("event", "unknown")
+    if event.get("taskId") is not None:
+        field = f"{field}:{event['taskId']}"
+    pipe.publish(key, line)
+    pipe.hset(key, field, line)
+    pipe.expire(key, ttl)
+    return pipe
+
+
+def publish_progress(redis_client, job_id: str, event: str, **fields):
+    """Publish a progress event from the worker itself, in the agent's event format."""
+    record = {"event": event, "jobId": job_id, "ts": round(time.time(), 3), **fields}
+    queue_progress(redis_client.pipeline(transaction=False), job_id, json.dumps(record, default=str), record).execute()
+
+
+class ProgressRelay:
+    """
+    Relays the agent's JSON-lines progress events to Redis.
+
+    The agent writes to `write_fd` (passed as --events-fd); a reader thread
+    publishes each event on the `progress:{jobId}` channel and keeps the
+    latest event per (event, taskId) in the `progress:{jobId}` hash, so a
+    dashboard that connects late still sees where the job stands.
+    """
+
+    def __init__(self, redis_client, job_id: str, ttl: int = PROGRESS_TTL):
+        self.redis_client = redis_client
+        self.job_id = job_id
+        self.ttl = ttl
+        self.read_fd, self.write_fd = os.pipe()
+        self.events = 0
+        self.errors = 0
+        self._reader: threading.Thread | None = None
+        self._closed = False
+
+    def start(self):
+        """Start relaying; call once the agent process holds its copy of `write_fd`."""
+        os.close(self.write_fd)
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        with os.fdopen(self.read_fd, "r", encoding="utf-8", errors="replace") as events:
+            for line in events:
+                line = line.strip()
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                try:
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    queue_progress(pipe, self.job_id, line, event, self.ttl).execute()
+                    self.events += 1
+                except Exception as e:
+                    # Keep draining the pipe so the agent never blocks on it
+                    self.errors += 1
+                    if self.errors == 1:
+                        print(f"[WARN] Could not publish progress events: {e}")
+
+    @property
+    def started(self) -> bool:
+        return self._reader is not None
+
+    def close(self):
+        """Wait until the agent closed its end and every event is relayed."""
+        if self._reader:
+            self._reader.join()
+        elif not self._closed:
+            # Never started: the agent did not get its end either
+            os.close(self.write_fd)
+            os.close(self.read_fd)
+        self._closed = True
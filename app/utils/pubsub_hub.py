@@ -0,0 +1,191 @@
+import asyncio
+import os
+from redis.exceptions import ConnectionError as RedisConnectionError
+from utils.redis_client import get_redis
+
+# Messages buffered per SSE client before it is considered too slow and dropped
+CLIENT_QUEUE_SIZE = int(os.getenv("SSE_CLIENT_QUEUE_SIZE", "1000"))
+KEEP_ALIVE_SECONDS = float(os.getenv("SSE_KEEP_ALIVE_SECONDS", "10"))
+
+
+class SlowClientError(Exception):
+    """Raised to a subscriber whose queue overflowed."""
+
+
+class Subscription:
+    """Per-client queue of messages published on one channel or stream."""
+
+    def __init__(self, channel: str, maxsize: int):
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = False
+
+    def push(self, data) -> bool:
+        try:
+            self.queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            return False
+
+    async def get(self, timeout: float = KEEP_ALIVE_SECONDS):
+        """Next message, or None if nothing arrived within `timeout` seconds."""
+        if self.dropped:
+            raise SlowClientError(self.channel)
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class PubSubHub:
+    """
+    A single Redis pattern subscription shared by every SSE client of the process.
+
+    Messages are fanned out to in-memory per-client queues, so the number of
+    Redis connections no longer grows with the number of viewers. A client
+    that lets its queue fill up is dropped rather than slowing the others.
+    """
+
+    def __init__(self, patterns: tuple[str, ...] = ("status:*",), queue_size: int = CLIENT_QUEUE_SIZE):
+        self.patterns = patterns
+        self.queue_size = queue_size
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        backoff = 0.5
+        while True:
+            pubsub = get_redis().pubsub()
+            try:
+                await pubsub.psubscribe(*self.patterns)
+                backoff = 0.5
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+            except (RedisConnectionError, OSError) as e:
+                print(f"[WARN] Pub/sub connection lost, reconnecting in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                await pubsub.aclose()
+
+    def _dispatch(self, channel: str, data: str):
+        for subscription in list(self._subscriptions.get(channel, ())):
+            if not subscription.push(data):
+                self.unsubscribe(subscription)
+
+    def subscribe(self, channel: str) -> Subscription:
+        self.start()
+        subscription = Subscription(channel, self.queue_size)
+        self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscriptions.get(subscription.channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscriptions[subscription.channel]
+
+    def client_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscriptions.values())
+
+
+def parse_stream_id(entry_id: str) -> tuple[int, int]:
+    """Turn a Redis Stream entry ID ("<ms>-<seq>") into a comparable tuple."""
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class StreamHub:
+    """
+    Tails the Redis Streams of every watched job with a single blocking XREAD.
+
+    Subscribers receive `(entry_id, fields)` tuples. A client first subscribes,
+    then reads its backlog with XRANGE and finally calls `watch()` with the last
+    ID it saw, so entries are neither lost nor needed twice between the two.
+    """
+
+    def __init__(self, queue_size: int = CLIENT_QUEUE_SIZE, block_ms: int = 1000, batch: int = 500):
+        self.queue_size = queue_size
+        self.block_ms = block_ms
+        self.batch = batch
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        self._cursors: dict[str, str] = {}
+        self._watching = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        redis = get_redis()
+        backoff = 0.5
+        while True:
+            if not self._cursors:
+                self._watching.clear()
+                await self._watching.wait()
+            try:
+                response = await redis.xread(dict(self._cursors), count=self.batch, block=self.block_ms)
+                backoff = 0.5
+            except (RedisConnectionError, OSError) as e:
+                print(f"[WARN] Stream tail connection lost, reconnecting in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            for key, entries in response or ():
+                for entry_id, fields in entries:
+                    if key in self._cursors:
+                        self._cursors[key] = entry_id
+                    for subscription in list(self._subscriptions.get(key, ())):
+                        if not subscription.push((entry_id, fields)):
+                            self.unsubscribe(subscription)
+
+    def subscribe(self, key: str) -> Subscription:
+        self.start()
+        subscription = Subscription(key, self.queue_size)
+        self._subscriptions.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def watch(self, key: str, last_id: str):
+        """Start tailing `key` after `last_id` unless it is already tailed."""
+        if key in self._subscriptions and key not in self._cursors:
+            self._cursors[key] = last_id
+            self._watching.set()
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscriptions.get(subscription.channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscriptions[subscription.channel]
+                self._cursors.pop(subscription.channel, None)
+
+
+# One subscriber and one stream reader per API process
+hub = PubSubHub(("status:*", "progress:*"))
+stream_hub = StreamHub()
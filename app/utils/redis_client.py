@@ -0,0 +1,31 @@
+import os
+import redis.asyncio as aioredis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://10.115.18.147:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+
+_pool: aioredis.ConnectionPool | None = None
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    Async Redis client for the API process.
+
+    All clients share one connection pool, so request handlers borrow an
+    already open connection instead of connecting per request.
+    """
+    global _pool
+    if _pool is None:
+        _pool = aioredis.ConnectionPool.from_url(
+            REDIS_URL,
+            decode_responses=True,
+            max_connections=REDIS_MAX_CONNECTIONS
+        )
+    return aioredis.Redis(connection_pool=_pool)
+
+
+async def close_redis():
+    global _pool
+    if _pool is not None:
+        await _pool.disconnect()
+        _pool = None
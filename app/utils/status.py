@@ -1,34 +1,23 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
-import redis.asyncio as aioredis
-import asyncio
-import httpx
+from utils.pubsub_hub import hub, SlowClientError
 
 router = APIRouter()
 
-REDIS_URL = "redis://10.115.18.147:6379/0"  # adjust for your Redis connection
-
 async def event_generator(job_id: str):
-    redis = await aioredis.from_url(REDIS_URL, decode_responses=True)
-    pubsub = redis.pubsub()
-    channel = f"status:{job_id}"
-
-    await pubsub.subscribe(channel)
+    subscription = hub.subscribe(f"status:{job_id}")
     try:
         while True:
-            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=10)
-            if message:
-                data = message["data"]
-                print(data)
+            data = await subscription.get()
+            if data is not None:
                 yield f"data: {data}\n\n"
             else:
                 # Send a comment to keep connection alive (optional)
                 yield ": keep-alive\n\n"
-            await asyncio.sleep(0.1)
+    except SlowClientError:
+        yield ": disconnected, client too slow\n\n"
     finally:
-        await pubsub.unsubscribe(channel)
-        await pubsub.close()
-        await redis.close()
+        hub.unsubscribe(subscription)
 
 @router.get("/status/{job_id}")
 async def status_stream(request: Request, job_id: str):
@@ -51,21 +40,3 @@ async def status_stream(request: Request, job_id: str):
     }
 
     return StreamingResponse(event_streamer(), headers=headers)
-
-async def send_status_webhook(jobId: str, status: str):
-    url = "https://paradigm-shift.ai/api/webhook"  # Replace with your endpoint
-
-    data = {
-        "type": "job_status",  # Replace with actual type
-        "payload": {
-            "status": status,
-            "id": jobId
-        }
-    }
-
-    print(data)
-
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=data)
-        print(f"Status Code: {response.status_code}")
-        print(f"Response Body: {response.text}")
\ No newline at end of file
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+import httpx
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from utils.redis_client import get_redis
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://paradigm-shift.ai/api/webhook")
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "10"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_BACKOFF_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_SECONDS", "1"))
+WEBHOOK_MAX_BACKOFF_SECONDS = float(os.getenv("WEBHOOK_MAX_BACKOFF_SECONDS", "300"))
+WEBHOOK_DEAD_LETTER_MAX = int(os.getenv("WEBHOOK_DEAD_LETTER_MAX", "10000"))
+
+# Latest undelivered event per job, when each job is next due, and the events given up on
+OUTBOX_KEY = "webhook:outbox"
+DUE_KEY = "webhook:due"
+DEAD_LETTER_KEY = "webhook:dead"
+
+
+def lease_key(job_id: str) -> str:
+    """Held by whichever process is delivering the job's webhook right now."""
+    return f"webhook:lease:{job_id}"
+
+
+# Only touch an outbox entry if it is still the event that was delivered;
+# a newer status that arrived meanwhile must survive
+_ACK = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+_RETRY = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+    redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+    return 1
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_DEAD = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    redis.call('LPUSH', KEYS[2], ARGV[3])
+    redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[4]) - 1)
+    return 1
+end
+return 0
+"""
+
+
+def queue_status_webhook(pipe, job_id: str, status: str):
+    """
+    Add the webhook of a status change to a Redis pipeline, sync or async.
+
+    Only the latest status of a job is kept, so a lagging dispatcher sends
+    one webhook with the current status rather than the whole backlog.
+    """
+    event = {"jobId": job_id, "status": status, "attempts": 0, "queued_at": time.time()}
+    pipe.hset(OUTBOX_KEY, job_id, json.dumps(event))
+    pipe.zadd(DUE_KEY, {job_id: time.time()})
+    return pipe
+
+
+def webhook_body(event: dict) -> dict:
+    return {"type": "job_status", "payload": {"status": event["status"], "id": event["jobId"]}}
+
+
+class WebhookDispatcher:
+    """
+    Delivers queued status webhooks in the background of the API process.
+
+    A delivery first takes the job's lease (`webhook:lease:{jobId}`), then
+    claims it from the `webhook:due` sorted set with ZREM. At most one POST
+    per job is in flight across all API processes, so statuses arrive in
+    order: a newer status queued meanwhile waits until the lease is released.
+    Several API processes can dispatch side by side. Each delivery is a POST
+    over one persistent, pooled client. 5xx, 429 and network errors are
+    retried with exponential backoff and jitter. Other 4xx responses and
+    events out of attempts go to the `webhook:dead` list.
+
+    `redis`, `client` and `url` can be swapped for local stand-ins.
+    """
+
+    def __init__(self, url: str = WEBHOOK_URL, redis=None, client: httpx.AsyncClient | None = None,
+                 concurrency: int = WEBHOOK_CONCURRENCY, max_attempts: int = WEBHOOK_MAX_ATTEMPTS,
+                 poll_seconds: float = 0.5):
+        self.url = url
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.poll_seconds = poll_seconds
+        self._redis = redis
+        self._client = client
+        self._owns_client = client is None
+        self._deliveries: set[asyncio.Task] = set()
+        # Outlives a delivery's POST, so it only expires if its process died
+        self.lease_ms = int((WEBHOOK_TIMEOUT * 2 + 10) * 1000)
+        self._task: asyncio.Task | None = None
+        self._scripts = None
+        self.stats = {"delivered": 0, "retried": 0, "dead": 0}
+
+    def _redis_client(self):
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def _script(self, name: str):
+        if self._scripts is None:
+            redis = self._redis_client()
+            self._scripts = {key: redis.register_script(source) for key, source in
+                             (("ack", _ACK), ("retry", _RETRY), ("dead", _DEAD), ("release", _RELEASE))}
+        return self._scripts[name]
+
+    def start(self):
+        if self._task is None or self._task.done():
+            if self._client is None:
+                self._client = httpx.AsyncClient(
+                    timeout=WEBHOOK_TIMEOUT,
+                    limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+                )
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._deliveries:
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self):
+        backoff = 0.5
+        last_recovery = 0.0
+        while True:
+            try:
+                # Events claimed by a process that died before finishing them
+                if time.monotonic() - last_recovery > 60:
+                    await self.recover()
+                    last_recovery = time.monotonic()
+                dispatched = await self.dispatch_due()
+                backoff = 0.5
+            except (RedisConnectionError, OSError) as e:
+                print(f"[WARN] Webhook outbox unavailable, retrying in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            if not dispatched:
+                await asyncio.sleep(self.poll_seconds)
+
+    async def recover(self):
+        """Reschedule outbox events that are not due; leased ones wait for their delivery in dispatch_due."""
+        redis = self._redis_client()
+        job_ids = await redis.hkeys(OUTBOX_KEY)
+        if job_ids:
+            await redis.zadd(DUE_KEY, {job_id: time.time() for job_id in job_ids}, nx=True)
+
+    async def dispatch_due(self) -> int:
+        """Start deliveries for due events while there is capacity. Returns how many started."""
+        free = self.concurrency - len(self._deliveries)
+        if free <= 0:
+            return 0
+        redis = self._redis_client()
+        due = await redis.zrangebyscore(DUE_KEY, "-inf", time.time(), start=0, num=free)
+        started = 0
+        for job_id in due:
+            token = uuid.uuid4().hex
+            if not await redis.set(lease_key(job_id), token, nx=True, px=self.lease_ms):
+                # An older status of this job is being delivered, here or elsewhere; send this one after it
+                await redis.zadd(DUE_KEY, {job_id: time.time() + self.poll_seconds}, xx=True)
+                continue
+            # Whoever removes it owns the delivery
+            if await redis.zrem(DUE_KEY, job_id):
+                delivery = asyncio.create_task(self._deliver(job_id, token))
+                self._deliveries.add(delivery)
+                delivery.add_done_callback(self._deliveries.discard)
+                started += 1
+            else:
+                await self._script("release")(keys=[lease_key(job_id)], args=[token])
+        return started
+
+    async def _deliver(self, job_id: str, token: str):
+        try:
+            await self._attempt(job_id)
+        except Exception as e:
+            # The event stays in the outbox and is rescheduled by recover()
+            print(f"[WARN] Webhook delivery of {job_id} interrupted: {e}")
+        finally:
+            try:
+                await self._script("release")(keys=[lease_key(job_id)], args=[token])
+            except Exception as e:
+                # The lease expires on its own
+                print(f"[WARN] Could not release webhook lease of {job_id}: {e}")
+
+    async def _attempt(self, job_id: str):
+        redis = self._redis_client()
+        raw = await redis.hget(OUTBOX_KEY, job_id)
+        if raw is None:
+            return
+        event = json.loads(raw)
+        try:
+            response = await self._client.post(self.url, json=webhook_body(event))
+            error = None if response.is_success else f"HTTP {response.status_code}: {response.text[:200]}"
+            retryable = response.status_code >= 500 or response.status_code == 429
+        except httpx.HTTPError as e:
+            error, retryable = f"{type(e).__name__}: {e}", True
+
+        if error is None:
+            await self._script("ack")(keys=[OUTBOX_KEY], args=[job_id, raw])
+            self.stats["delivered"] += 1
+            return
+
+        event["attempts"] += 1
+        event["last_error"] = error
+        if retryable and event["attempts"] < self.max_attempts:
+            delay = min(WEBHOOK_BACKOFF_SECONDS * 2 ** (event["attempts"] - 1), WEBHOOK_MAX_BACKOFF_SECONDS)
+            delay *= random.uniform(0.5, 1.0)
+            await self._script("retry")(keys=[OUTBOX_KEY, DUE_KEY],
+                                         args=[job_id, raw, json.dumps(event), time.time() + delay])
+            self.stats["retried"] += 1
+            print(f"[WARN] Webhook of {job_id} ({event['status']}) failed, retry {event['attempts']} in {delay:.1f}s: {error}")
+        else:
+            event["dead_at"] = time.time()
+            await self._script("dead")(keys=[OUTBOX_KEY, DEAD_LETTER_KEY],
+                                        args=[job_id, raw, json.dumps(event), WEBHOOK_DEAD_LETTER_MAX])
+            self.stats["dead"] += 1
+            print(f"[ERROR] Webhook of {job_id} ({event['status']}) dead-lettered after {event['attempts']} attempts: {error}")
+
+
+# One dispatcher per API process
+webhook_dispatcher = WebhookDispatcher()
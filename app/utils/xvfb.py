@@ -0,0 +1,101 @@
+import os
+import select
+import subprocess
+import threading
+import time
+
+XVFB_POOL_SIZE = int(os.getenv("XVFB_POOL_SIZE", "1"))
+XVFB_SCREEN = os.getenv("XVFB_SCREEN", "1024x768x24")
+XVFB_START_TIMEOUT = float(os.getenv("XVFB_START_TIMEOUT", "10"))
+
+
+class XvfbDisplay:
+    """A running Xvfb server and the display it serves."""
+
+    def __init__(self, process: subprocess.Popen, display: str):
+        self.process = process
+        self.display = display
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self):
+        if self.is_alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class XvfbPool:
+    """
+    Reuses Xvfb servers across headed jobs.
+
+    Xvfb picks a free display itself and reports it on the `-displayfd` pipe
+    once it accepts connections, so there is no guessing of display numbers
+    and no fixed startup sleep.
+    """
+
+    def __init__(self, size: int = XVFB_POOL_SIZE, screen: str = XVFB_SCREEN):
+        self.size = size
+        self.screen = screen
+        self._idle: list[XvfbDisplay] = []
+        self._lock = threading.Lock()
+
+    def _launch(self) -> XvfbDisplay:
+        read_fd, write_fd = os.pipe()
+        try:
+            process = subprocess.Popen(
+                ["Xvfb", "-displayfd", str(write_fd), "-screen", "0", self.screen, "-nolisten", "tcp"],
+                pass_fds=(write_fd,),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        finally:
+            os.close(write_fd)
+
+        try:
+            output = b""
+            deadline = time.monotonic() + XVFB_START_TIMEOUT
+            while not output.endswith(b"\n"):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([read_fd], [], [], remaining)[0]:
+                    break
+                chunk = os.read(read_fd, 32)
+                if not chunk:
+                    break
+                output += chunk
+        finally:
+            os.close(read_fd)
+
+        if not output.strip().isdigit():
+            XvfbDisplay(process, "").close()
+            raise RuntimeError("Xvfb did not report a ready display")
+        return XvfbDisplay(process, f":{output.strip().decode()}")
+
+    def acquire(self) -> XvfbDisplay:
+        with self._lock:
+            while self._idle:
+                display = self._idle.pop()
+                if display.is_alive():
+                    return display
+        return self._launch()
+
+    def release(self, display: XvfbDisplay):
+        with self._lock:
+            if display.is_alive() and len(self._idle) < self.size:
+                self._idle.append(display)
+                return
+        display.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for display in idle:
+            display.close()
+
+
+# One pool per Celery worker process
+xvfb_pool = XvfbPool()